@@ -0,0 +1,3 @@
+#
+# Benchmarks for the extractor. Run them with "python -m benchmarks".
+#
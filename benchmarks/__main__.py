@@ -0,0 +1,93 @@
+#
+# Runs the benchmarks on a synthetic game and compares the results with a baseline.
+#
+# python -m benchmarks -o results.json
+# python -m benchmarks --baseline results.json --threshold 0.1
+#
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+
+import PIL
+
+from .generate import makegame
+from .suite import BENCHMARKS, Game, SkipBenchmark, runbenchmark
+
+
+def compareresults(results, baseline, threshold):
+    """
+    Compares the median times of each benchmark in both results.
+    Returns (name, baseline median, median, change) for each benchmark that is slower than
+    the baseline by more than threshold, where 0.1 means 10%.
+    """
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None or not base["median"]:
+            continue
+        change = result["median"] / base["median"] - 1
+        if change > threshold:
+            regressions.append((name, base["median"], result["median"], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Times the extractor's decode, render and export paths.")
+    parser.add_argument("names", nargs="*", metavar="name", help="the benchmarks to run, all of them by default")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="the slowdown that counts as a regression, default 0.1 for 10%%")
+    parser.add_argument("--repeat", type=int, default=5, help="the number of timed runs, default 5")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    args = parser.parse_args(argv)
+    if args.list:
+        for name in BENCHMARKS:
+            print(name)
+        return 0
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark: " + name)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "benchmarks": {},
+        "skipped": {},
+    }
+    with tempfile.TemporaryDirectory() as workfolder:
+        gamefolder = os.path.join(workfolder, "game")
+        game = Game(gamefolder, makegame(gamefolder), workfolder)
+        for name in args.names or BENCHMARKS:
+            try:
+                result = runbenchmark(name, game, args.repeat)
+            except SkipBenchmark as ex:
+                results["skipped"][name] = str(ex)
+                print("{:<20} skipped: {}".format(name, ex))
+                continue
+            results["benchmarks"][name] = result
+            print("{:<20} {:10.2f} ms median {:10.2f} ms min".format(name, result["median"], result["min"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if baseline is not None:
+        regressions = compareresults(results, baseline, args.threshold)
+        for name, before, after, change in regressions:
+            print("Regression: {} {:.2f} ms -> {:.2f} ms ({:+.0%})".format(name, before, after, change))
+        if regressions:
+            return 1
+        print("No regressions over {:.0%} against {}".format(args.threshold, args.baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
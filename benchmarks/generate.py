@@ -0,0 +1,136 @@
+#
+# Generators for synthetic game files.
+# The files have the same layout as the game's files but are filled with random pixels.
+#
+
+import os
+import random
+import struct
+
+# The sizes that CEL files without a header can have.
+HEADERLESS_CEL_SIZES = {
+    (64, 64): 4096,
+    (65, 64): 4160,
+    (64, 56): 3594,
+}
+PAK_FRAME_SIZE = 4096
+
+
+def _randombytes(rnd, count):
+    """Returns count random bytes."""
+    return rnd.getrandbits(count * 8).to_bytes(count, byteorder="little") if count else b""
+
+
+def _vgapalette(rnd):
+    """Returns a random 6-bit VGA palette."""
+    return bytes(rnd.randrange(64) for _ in range(768))
+
+
+def writepalette(filename, rnd):
+    """Writes a PALETTE.PAL file."""
+    with open(filename, "wb") as f:
+        f.write(_vgapalette(rnd))
+
+
+def writecel(filename, rnd, size=(64, 64), header=False):
+    """
+    Writes a CEL file.
+    With header, the file starts with the 0x1991 header and includes its own palette and can
+    be any size. Otherwise size must be one of HEADERLESS_CEL_SIZES and the file needs a
+    PALETTE.PAL file next to it.
+    """
+    width, height = size
+    with open(filename, "wb") as f:
+        if header:
+            f.write(b"\x19\x91" + struct.pack("<HH", width, height))
+            f.write(bytes(0x20 - 6))
+            f.write(_vgapalette(rnd))
+            f.write(_randombytes(rnd, width * height))
+        else:
+            f.write(_randombytes(rnd, HEADERLESS_CEL_SIZES[size]))
+
+
+def writepak(filename, rnd, frames):
+    """Writes a PAK file with the given number of 64x64 frames."""
+    with open(filename, "wb") as f:
+        f.write(_randombytes(rnd, PAK_FRAME_SIZE * frames))
+
+
+def _chunk(chunktype, data):
+    return struct.pack("<IH", 6 + len(data), chunktype) + data
+
+
+def _linedelta(lines, width):
+    """Returns an FLI_LC chunk that copies whole lines, starting at lines[0]."""
+    data = bytearray(struct.pack("<HH", lines[0][0], len(lines)))
+    for y, line in lines:
+        packets = [line[x:x + 127] for x in range(0, width, 127)]
+        data.append(len(packets))
+        for packet in packets:
+            data += bytes((0, len(packet))) + packet
+    if len(data) % 2:
+        data.append(0)
+    return _chunk(12, bytes(data))
+
+
+def writefli(filename, rnd, size=(320, 200), frames=30, changedlines=20, speed=5):
+    """
+    Writes an FLI animation.
+    The first frame holds the palette and every pixel. Each later frame changes a band of
+    changedlines lines like the game's animations do.
+    """
+    width, height = size
+    pixels = bytearray(_randombytes(rnd, width * height))
+    body = []
+    for frame in range(frames):
+        if frame == 0:
+            chunks = [_chunk(11, struct.pack("<HBB", 1, 0, 0) + _vgapalette(rnd)),
+                      _chunk(16, bytes(pixels))]
+        else:
+            top = rnd.randrange(height - changedlines + 1)
+            lines = []
+            for y in range(top, top + changedlines):
+                line = _randombytes(rnd, width)
+                pixels[y * width:(y + 1) * width] = line
+                lines.append((y, line))
+            chunks = [_linedelta(lines, width)]
+        data = b"".join(chunks)
+        body.append(struct.pack("<IHH8x", 16 + len(data), 0xF1FA, len(chunks)) + data)
+    body = b"".join(body)
+    with open(filename, "wb") as f:
+        header = struct.pack("<IHHHHHHH", 128 + len(body), 0xAF11, frames, width, height, 8, 0, speed)
+        f.write(header.ljust(128, b"\0"))
+        f.write(body)
+
+
+def makegame(folder, folders=4, cels=25, paks=2, flis=1, seed=1):
+    """
+    Fills a folder with a synthetic game: a PALETTE.PAL and a mix of both kinds of CEL file,
+    PAK files and FLI animations in each of several subfolders.
+    Returns a dict of sample file names for the benchmarks: "cel", "headercel", "pak" and "fli".
+    """
+    rnd = random.Random(seed)
+    samples = {}
+    for index in range(folders):
+        subfolder = os.path.join(folder, "AREA{}".format(index))
+        os.makedirs(subfolder, exist_ok=True)
+        writepalette(os.path.join(subfolder, "PALETTE.PAL"), rnd)
+        for number in range(cels):
+            filename = os.path.join(subfolder, "WALL{:02}.CEL".format(number))
+            if number % 5 == 4:
+                writecel(filename, rnd, (rnd.randrange(16, 321), rnd.randrange(16, 201)), header=True)
+            else:
+                writecel(filename, rnd)
+                samples.setdefault("cel", filename)
+        for number in range(paks):
+            filename = os.path.join(subfolder, "TILES{}.PAK".format(number))
+            writepak(filename, rnd, 64)
+            samples.setdefault("pak", filename)
+        for number in range(flis):
+            filename = os.path.join(subfolder, "ANIM{}.FLI".format(number))
+            writefli(filename, rnd)
+            samples.setdefault("fli", filename)
+    # A full screen image for the CEL format with a header.
+    samples["headercel"] = os.path.join(folder, "AREA0", "SCREEN.CEL")
+    writecel(samples["headercel"], rnd, (320, 200), header=True)
+    return samples
@@ -0,0 +1,214 @@
+#
+# The benchmarks for the extractor's hot paths.
+# Each one is a context manager that sets up its inputs and yields the function to time.
+#
+
+import collections
+import contextlib
+import os
+import statistics
+import time
+
+from extractor.exporter import planexport, runtasks
+from extractor.imagefile import getframecount, openimage
+from extractor.keyframes import KeyframeSeeker
+from extractor.pil import CelImagePlugin
+
+BENCHMARKS = collections.OrderedDict()
+
+Game = collections.namedtuple("Game", "folder samples workfolder")
+
+
+class SkipBenchmark(Exception):
+    """Raised by a benchmark that can't run here, such as one that needs a display."""
+
+
+def benchmark(name):
+    """Registers a benchmark under a name."""
+    def decorator(function):
+        BENCHMARKS[name] = contextlib.contextmanager(function)
+        return function
+    return decorator
+
+
+def _findfiles(folder, extension):
+    return sorted(os.path.join(path, filename)
+                  for path, dirnames, filenames in os.walk(folder)
+                  for filename in filenames
+                  if filename.lower().endswith(extension))
+
+
+def _loadfiles(filenames):
+    for filename in filenames:
+        image = openimage(filename)
+        image.load()
+
+
+def _loadframes(filename, frames):
+    image = openimage(filename)
+    for frame in frames:
+        image.seek(frame)
+        image.load()
+
+
+@benchmark("image.open")
+def _imageopen(game):
+    """Opens every game file without decoding it."""
+    filenames = [filename for extension in (".cel", ".pak", ".fli")
+                 for filename in _findfiles(game.folder, extension)]
+    yield lambda: [openimage(filename) for filename in filenames]
+
+
+@benchmark("cel.load.left")
+def _celloadleft(game):
+    """Opens and decodes every CEL file without a header. These are stored column-major."""
+    filenames = [filename for filename in _findfiles(game.folder, ".cel")
+                 if os.path.getsize(filename) in (4096, 4160, 3594)]
+    yield lambda: _loadfiles(filenames)
+
+
+@benchmark("cel.load.top")
+def _celloadtop(game):
+    """Opens and decodes a full screen CEL file with a header 20 times."""
+    filenames = [game.samples["headercel"]] * 20
+    yield lambda: _loadfiles(filenames)
+
+
+@benchmark("cel.palette.cold")
+def _celpalettecold(game):
+    """Opens and decodes every CEL file without a header after forgetting the cached palettes."""
+    filenames = [filename for filename in _findfiles(game.folder, ".cel")
+                 if os.path.getsize(filename) in (4096, 4160, 3594)]
+
+    def run():
+        CelImagePlugin.clearpalettecache()
+        _loadfiles(filenames)
+    yield run
+
+
+@benchmark("pak.seek")
+def _pakseek(game):
+    """Opens a PAK file and decodes each frame in order."""
+    filename = game.samples["pak"]
+    frames = range(getframecount(openimage(filename)))
+    yield lambda: _loadframes(filename, frames)
+
+
+@benchmark("fli.seek")
+def _fliseek(game):
+    """Opens an FLI animation and decodes each frame in order."""
+    filename = game.samples["fli"]
+    frames = range(getframecount(openimage(filename)))
+    yield lambda: _loadframes(filename, frames)
+
+
+@benchmark("fli.seek.reverse")
+def _fliseekreverse(game):
+    """Opens an FLI animation and decodes each frame from last to first, like stepping backwards."""
+    filename = game.samples["fli"]
+    frames = range(getframecount(openimage(filename)) - 1, -1, -1)
+    yield lambda: _loadframes(filename, frames)
+
+
+@benchmark("fli.seek.keyframes")
+def _fliseekkeyframes(game):
+    """Decodes each frame of an FLI animation from last to first through a KeyframeSeeker that has every keyframe."""
+    image = openimage(game.samples["fli"])
+    seeker = KeyframeSeeker(image)
+    n_frames = getframecount(image)
+    for frame in range(n_frames):
+        seeker.seek(frame)
+
+    def run():
+        for frame in range(n_frames - 1, -1, -1):
+            seeker.seek(frame)
+    yield run
+
+
+def _imagelabel(filename):
+    """Returns a Tk root window and an ImageLabel showing a file at twice its size."""
+    try:
+        import tkinter
+        import tkinter.tix as tix
+        from extractor.imagelabel import ImageLabel
+    except ImportError as ex:
+        raise SkipBenchmark(str(ex))
+    try:
+        root = tix.Tk()
+    except tkinter.TclError as ex:
+        raise SkipBenchmark(str(ex))
+    label = ImageLabel(root)
+    label.pack(fill=tix.BOTH, expand=True)
+    label.imagescale.set(2)
+    label.open(filename)
+    root.update()
+    return root, label
+
+
+def _render(root, label, clear):
+    for frame in range(label.n_frames.get()):
+        if clear:
+            label.rendercache.clear()
+        label.currentframe.set(frame)
+        root.update_idletasks()
+
+
+@benchmark("render.uncached")
+def _renderuncached(game):
+    """Shows each frame of an FLI animation, scaling it and making a new PhotoImage every time."""
+    root, label = _imagelabel(game.samples["fli"])
+    try:
+        yield lambda: _render(root, label, True)
+    finally:
+        root.destroy()
+
+
+@benchmark("render.cached")
+def _rendercached(game):
+    """Shows each frame of an FLI animation from the render cache."""
+    root, label = _imagelabel(game.samples["fli"])
+    try:
+        yield lambda: _render(root, label, False)
+    finally:
+        root.destroy()
+
+
+def _export(game, jobs):
+    manifest, tasks, skipped = planexport(game.folder, os.path.join(game.workfolder, "export"), True)
+    for result in runtasks(tasks, jobs, manifest):
+        if result.error is not None:
+            raise RuntimeError("{}: {}".format(result.infilename, result.error))
+    manifest.save()
+
+
+@benchmark("export.serial")
+def _exportserial(game):
+    """Exports the whole game in this process."""
+    yield lambda: _export(game, 1)
+
+
+@benchmark("export.parallel")
+def _exportparallel(game):
+    """Exports the whole game on a worker process per CPU like Save All Files does."""
+    yield lambda: _export(game, None)
+
+
+def runbenchmark(name, game, repeat=5, warmup=1):
+    """
+    Times a benchmark and returns its results in milliseconds.
+    Raises SkipBenchmark when it can't run here.
+    """
+    with BENCHMARKS[name](game) as function:
+        for x in range(warmup):
+            function()
+        times = []
+        for x in range(repeat):
+            starttime = time.perf_counter()
+            function()
+            times.append((time.perf_counter() - starttime) * 1000)
+    return {
+        "repeat": repeat,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+    }
@@ -1,9 +1,24 @@
+import argparse
+
 import extractor.main as ui
+from extractor import profiler
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Browses the graphics for the DOS game Isle of the Dead.")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="time the slow stages and save the timings to FILE on exit (or set {})".format(
+                            profiler.PROFILE_ENV))
+    parser.add_argument("--profile-format", choices=profiler.FORMATS,
+                        help="json for counters and histograms or chrome for a trace (default: json)")
+    args = parser.parse_args()
+    profilefile, profileformat = profiler.start(args.profile, args.profile_format)
     root = ui.MainApplication()
     root.mainloop()
+    if profilefile:
+        profiler.save(profilefile, profileformat)
 
 
-main()
+# The guard keeps export worker processes from opening another window.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#
+# NumPy arrays of the game's images for analysis tools.
+#
+# NumPy is optional. It is only needed when these functions are called.
+#
+
+from .framestream import iterframes
+from .imagefile import getframecount, openimage
+from .pil.CelImagePlugin import CelImageFile
+from .pil.PakImagePlugin import PakImageFile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _requirenumpy():
+    if numpy is None:
+        raise ImportError("extractor.arrays needs NumPy. Install it with: pip install numpy")
+
+
+def _palettearray(image):
+    """Returns the palette of an opened image as a 256 x 3 array."""
+    palette = image.palette
+    if palette is not None and palette.rawmode == "RGB":
+        # The palette data exactly as the plugin read it, before Pillow applies it.
+        data = bytes(palette.palette)
+    else:
+        data = bytes(image.getpalette() or b"")
+    return numpy.frombuffer(data[:768].ljust(768, b"\0"), dtype=numpy.uint8).reshape(256, 3)
+
+
+def _framesarray(image):
+    """Returns the frames of an opened image as an N x height x width array."""
+    filename = image.filename
+    if isinstance(image, PakImageFile):
+        width, height = image.size
+        frames = numpy.memmap(filename, dtype=numpy.uint8, mode="r", shape=(image.n_frames, width, height))
+        # Each frame is stored a column at a time.
+        return frames.transpose(0, 2, 1)
+    if isinstance(image, CelImageFile):
+        decoder, extents, offset, args = image.tile[0]
+        width, height = extents[2] - extents[0], extents[3] - extents[1]
+        frame = numpy.memmap(filename, dtype=numpy.uint8, mode="r", offset=offset, shape=(height, width))
+        if image._orientation == CelImageFile.LEFT:
+            frame = frame.T
+        return frame[numpy.newaxis]
+    width, height = image.size
+    frames = numpy.empty((getframecount(image), height, width), dtype=numpy.uint8)
+    for frame, frameimage in iterframes(image):
+        frames[frame] = numpy.frombuffer(frameimage.tobytes(), dtype=numpy.uint8).reshape(height, width)
+    return frames
+
+
+def framesarray(filename):
+    """
+    Returns the palette indexes of every frame of a file as an N x height x width uint8 array.
+
+    PAK files and CEL files are read-only views of a memory-mapped file, so nothing is decoded
+    or copied. Column-major frames are transposed views. FLI animations are decoded into a new array.
+    """
+    _requirenumpy()
+    return _framesarray(openimage(filename))
+
+
+def palettearray(filename):
+    """Returns the palette that a file is shown with as a 256 x 3 uint8 array of 8-bit RGB values."""
+    _requirenumpy()
+    return _palettearray(openimage(filename))
+
+
+def loadarrays(filename):
+    """Returns (framesarray(filename), palettearray(filename)), opening the file once for both."""
+    _requirenumpy()
+    image = openimage(filename)
+    # Read the palette first since decoding FLI frames applies it.
+    palette = _palettearray(image)
+    return _framesarray(image), palette
+
+
+def histogram(frames):
+    """Returns how many pixels use each of the 256 palette indexes in an array of frames."""
+    _requirenumpy()
+    return numpy.bincount(numpy.asarray(frames, dtype=numpy.uint8).ravel(), minlength=256)
+
+
+def recolor(frames, table):
+    """
+    Returns a copy of an array of frames with each palette index replaced by table[index].
+    table is a sequence of 256 indexes.
+    """
+    _requirenumpy()
+    return numpy.asarray(table, dtype=numpy.uint8)[frames]
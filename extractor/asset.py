@@ -0,0 +1,44 @@
+#
+# An opened image file, ready for display.
+#
+
+import os
+
+from . import profiler
+from .cache import FrameCache
+from .imagefile import openimage, getframecount, getduration
+from .keyframes import KeyframeSeeker, canseek, sidecarfilename
+
+
+def assetkey(filename):
+    """Returns a key that identifies the current contents of a file: (filename, mtime, size)."""
+    st = os.stat(filename)
+    return filename, st.st_mtime_ns, st.st_size
+
+
+def assetsize(asset):
+    """Returns the number of bytes used by an asset's decoded frames."""
+    return asset.frames.nbytes
+
+
+class Asset:
+    """
+    An opened image file with its frame count, animation speed, palette and frames.
+    Opening an asset decodes its first frame. The others are decoded as they are needed.
+    FLI animations seek through keyframes, which are kept in a sidecar file in keyframefolder
+    when it is given.
+    """
+
+    @profiler.timed("asset.open")
+    def __init__(self, filename, maxframes=None, maxbytes=None, keyframefolder=None):
+        self.filename = filename
+        self.key = assetkey(filename)
+        self.image = openimage(filename)
+        self.n_frames = getframecount(self.image)
+        self.duration = getduration(self.image)
+        seeker = None
+        if self.n_frames > 1 and canseek(self.image):
+            sidecar = sidecarfilename(filename, keyframefolder) if keyframefolder else None
+            seeker = KeyframeSeeker(self.image, sidecar=sidecar, writesidecar=sidecar is not None)
+        self.frames = FrameCache(self.image, self.n_frames, maxframes, maxbytes, seeker)
+        self.palette = self.frames[0].getpalette()
@@ -0,0 +1,180 @@
+#
+# Packs the frames of many images into a few large sprite sheets with a JSON index.
+#
+
+import collections
+import hashlib
+import json
+import os
+
+from PIL import Image
+
+from .framestream import iterframes
+from .imagefile import openimage, getduration
+
+
+class ShelfPacker:
+    """
+    Places rectangles left to right in rows, or shelves, starting a new shelf when a row is full.
+    The game's frames are mostly the same size, so this packs them tightly in a single pass.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.usedwidth = 0
+        self._x = 0
+        self._shelfy = 0
+        self._shelfheight = 0
+
+    @property
+    def usedheight(self):
+        return self._shelfy + self._shelfheight
+
+    def add(self, width, height):
+        """Returns the (x, y) position for a rectangle or None when the sheet is full."""
+        if self._x + width > self.width:
+            self._x = 0
+            self._shelfy += self._shelfheight
+            self._shelfheight = 0
+        if width > self.width or self._shelfy + height > self.height:
+            return None
+        position = self._x, self._shelfy
+        self._x += width
+        self._shelfheight = max(self._shelfheight, height)
+        self.usedwidth = max(self.usedwidth, self._x)
+        return position
+
+
+class AtlasWriter:
+    """
+    Writes frames to indexed PNG sheets named <outbase>-<n>.png and an index named <outbase>.json.
+
+    Frames are grouped by palette since an indexed sheet can only have one. Only the sheet being
+    filled for each palette is kept in memory; full sheets are saved and released right away.
+    At most maxopensheets sheets are kept, so when a new palette needs one, the sheet that was
+    least recently added to is saved as it is.
+    The index lists each sheet and, for each frame, its source file, frame number, sheet,
+    rectangle and duration in milliseconds. With dedupe, frames whose pixels and palette are
+    identical to an earlier frame share its rectangle instead of being stored again.
+    """
+
+    def __init__(self, outbase, maxsize=2048, dedupe=False, maxopensheets=8):
+        self.outbase = outbase
+        self.maxsize = maxsize
+        self.dedupe = dedupe
+        self.maxopensheets = maxopensheets
+        self._rectangles = {}
+        self.sheets = []
+        self.frames = []
+        self.files = []
+        # Maps palettes to their open sheets, least recently used first.
+        self._opensheets = collections.OrderedDict()
+
+    def addfile(self, image, source):
+        """
+        Adds every frame of an opened image. When a frame can't be decoded, the file's frames
+        are taken out of the index again before the error is raised. Their pixels stay in the sheets.
+        """
+        duration = getduration(image)
+        count = len(self.frames)
+        try:
+            for frame, frameimage in iterframes(image):
+                self.add(frameimage, source, frame, duration)
+        except Exception:
+            removed = set(id(entry) for entry in self.frames[count:])
+            del self.frames[count:]
+            self._rectangles = {digest: entry for digest, entry in self._rectangles.items()
+                                if id(entry) not in removed}
+            raise
+
+    def add(self, image, source, frame, duration):
+        """Adds a loaded "P" mode frame. Returns the frame's entry in the index."""
+        palette = bytes(image.getpalette())
+        width, height = image.size
+        if self.dedupe:
+            data = image.tobytes()
+            digest = hashlib.sha1(repr(image.size).encode() + palette + data).digest()
+            rectangle = self._rectangles.get(digest)
+            if rectangle is not None:
+                entry = dict(rectangle, source=source, frame=frame, duration=duration)
+                self.frames.append(entry)
+                return entry
+        sheet = self._opensheets.get(palette)
+        position = None
+        if sheet is not None:
+            self._opensheets.move_to_end(palette)
+            position = sheet[2].add(width, height)
+        if position is None:
+            if sheet is not None:
+                self._savesheet(palette)
+            sheet = self._newsheet(palette, width, height)
+            position = sheet[2].add(width, height)
+        sheetindex, sheetimage, packer = sheet
+        sheetimage.paste(image, position)
+        entry = {
+            "source": source,
+            "frame": frame,
+            "sheet": sheetindex,
+            "x": position[0],
+            "y": position[1],
+            "w": width,
+            "h": height,
+            "duration": duration,
+        }
+        self.frames.append(entry)
+        if self.dedupe:
+            self._rectangles[digest] = entry
+        return entry
+
+    def _newsheet(self, palette, width, height):
+        if len(self._opensheets) >= self.maxopensheets:
+            self._savesheet(next(iter(self._opensheets)))
+        # Frames that are larger than the maximum size get a sheet of their own.
+        size = max(width, self.maxsize), max(height, self.maxsize)
+        sheetimage = Image.new("P", size)
+        sheetimage.putpalette(palette)
+        sheet = len(self.sheets), sheetimage, ShelfPacker(*size)
+        self.sheets.append(None)
+        self._opensheets[palette] = sheet
+        return sheet
+
+    def _savesheet(self, palette):
+        sheetindex, sheetimage, packer = self._opensheets.pop(palette)
+        sheetimage = sheetimage.crop((0, 0, packer.usedwidth, packer.usedheight))
+        filename = "{}-{}.png".format(self.outbase, sheetindex)
+        sheetimage.save(filename)
+        self.files.append(filename)
+        self.sheets[sheetindex] = {
+            "file": os.path.basename(filename),
+            "width": sheetimage.width,
+            "height": sheetimage.height,
+        }
+
+    def close(self):
+        """Saves the remaining sheets and the index. Returns the names of the files that were written."""
+        for palette in list(self._opensheets):
+            self._savesheet(palette)
+        filename = self.outbase + ".json"
+        with open(filename, "w") as f:
+            json.dump({"sheets": self.sheets, "frames": self.frames}, f, indent=1)
+        self.files.append(filename)
+        return self.files
+
+
+def atlasfiles(filenames, outbase, root, maxsize=2048, dedupe=False):
+    """
+    Packs every frame of the given files into an atlas. Sources are named relative to root.
+    With dedupe, identical frames are only stored once.
+    Returns the names of the files that were written and a list of (filename, error) for files that failed.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(outbase)), exist_ok=True)
+    writer = AtlasWriter(outbase, maxsize, dedupe)
+    errors = []
+    for filename in filenames:
+        source = os.path.relpath(filename, root).replace(os.sep, "/")
+        try:
+            writer.addfile(openimage(filename), source)
+        except Exception as ex:
+            errors.append((filename, str(ex)))
+    return writer.close(), errors
@@ -0,0 +1,142 @@
+#
+# Bounded caches for decoded images.
+#
+
+import collections
+import threading
+
+from . import profiler
+
+
+def imagesize(image):
+    """Returns the approximate number of bytes used by an image's pixel data."""
+    return image.width * image.height * len(image.getbands())
+
+
+class LruCache:
+    """
+    A dictionary-like cache that discards the least recently used items once it
+    holds more than maxitems items or more than maxbytes bytes.
+    A limit of None means unlimited. sizeof returns the size of a value in bytes.
+    The most recently added item is always kept, even when it is over budget on its own.
+    """
+
+    def __init__(self, maxitems=None, maxbytes=None, sizeof=None):
+        self.maxitems = maxitems
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.nbytes = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        with self._lock:
+            value = self._items[key][0]
+            self._items.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self.pop(key)
+            size = self.sizeof(value)
+            self._items[key] = value, size
+            self.nbytes += size
+            self._evict()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            value, size = self._items.pop(key)
+            self.nbytes -= size
+            return value
+
+    def updatesize(self, key):
+        """Measures an item again after it has grown or shrunk, discarding items until the cache fits."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return
+            value, size = item
+            newsize = self.sizeof(value)
+            self._items[key] = value, newsize
+            self.nbytes += newsize - size
+            self._evict()
+
+    def setlimits(self, maxitems=None, maxbytes=None):
+        """Changes the limits, discarding items until the cache fits them."""
+        with self._lock:
+            self.maxitems = maxitems
+            self.maxbytes = maxbytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        while len(self._items) > 1 and ((self.maxitems is not None and len(self._items) > self.maxitems) or
+                                        (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+            value, size = self._items.popitem(last=False)[1]
+            self.nbytes -= size
+
+
+class FrameCache:
+    """
+    Decodes the frames of a multi-frame image on first access and keeps the most
+    recently used ones in an LruCache.
+    Supports len() and indexing like the list of frames that it replaces.
+    Frames are reached through seeker.seek when given a seeker, such as a KeyframeSeeker.
+    ondecode, when set, is called after each frame is decoded so that the owner can measure it again.
+    """
+
+    def __init__(self, image, n_frames, maxframes=None, maxbytes=None, seeker=None):
+        self.image = image
+        self.n_frames = n_frames
+        self.seeker = seeker
+        self.ondecode = None
+        self._frames = LruCache(maxframes, maxbytes, imagesize)
+
+    def __len__(self):
+        return self.n_frames
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.n_frames
+        if not 0 <= index < self.n_frames:
+            raise IndexError("frame index out of range")
+        frame = self._frames.get(index)
+        if frame is None:
+            with profiler.timer("frame.decode", frame=index):
+                if self.seeker is not None:
+                    self.seeker.seek(index)
+                else:
+                    self.image.seek(index)
+                    self.image.load()
+                frame = self.image.copy()
+            self._frames[index] = frame
+            if self.ondecode is not None:
+                self.ondecode()
+        return frame
+
+    def __iter__(self):
+        for index in range(self.n_frames):
+            yield self[index]
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the cached frames."""
+        return self._frames.nbytes
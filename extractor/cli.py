@@ -0,0 +1,133 @@
+#
+# Command line interface for running the extractor without a window.
+#
+# Only the viewer's widgets may import tkinter. The command line, the export worker processes and
+# the viewer's worker threads all use the other modules, so tests/test_headless.py checks that
+# none of them import it.
+#
+
+import argparse
+import os
+import sys
+import time
+
+from . import profiler
+from .atlas import atlasfiles
+from .exporter import compilecontainer, exportall, findfiles
+from .imagefile import usecontainer
+
+
+def _export(args):
+    starttime = time.monotonic()
+    count = 0
+    errors = 0
+    skipped, duplicates, results = exportall(args.gamefolder, args.outdir, args.jobs, args.full, args.dedupe)
+    try:
+        for result in results:
+            if result.error is None:
+                count += 1
+                if not args.quiet:
+                    print("Saved: " + result.outfilename)
+            else:
+                errors += 1
+                print("{}: {}".format(result.infilename, result.error), file=sys.stderr)
+    finally:
+        # Saves the manifest when the export is interrupted.
+        results.close()
+    elapsed = time.monotonic() - starttime
+    print("Exported {} files in {:.2f} seconds ({:.1f} files/s), {} duplicates, {} unchanged, {} errors".format(
+        count, elapsed, count / elapsed if elapsed else 0.0, duplicates, len(skipped), errors))
+    return 1 if errors else 0
+
+
+def _atlas(args):
+    starttime = time.monotonic()
+    if os.path.isdir(args.path):
+        filenames = sorted(infilename for infilename, outfilebase in findfiles(args.path, ""))
+        root = args.path
+    else:
+        filenames = [args.path]
+        root = os.path.dirname(args.path)
+    files, errors = atlasfiles(filenames, args.outbase, root, args.max_size, args.dedupe)
+    for filename, error in errors:
+        print("{}: {}".format(filename, error), file=sys.stderr)
+    if not args.quiet:
+        for filename in files:
+            print("Saved: " + filename)
+    print("Packed {} files into {} sheets in {:.2f} seconds, {} errors".format(
+        len(filenames) - len(errors), len(files) - 1, time.monotonic() - starttime, len(errors)))
+    return 1 if errors else 0
+
+
+def _compile(args):
+    starttime = time.monotonic()
+    count = 0
+    errors = 0
+    for result in compilecontainer(args.gamefolder, args.outfile, args.jobs):
+        if result.error is None:
+            count += 1
+            if not args.quiet:
+                print("Added: " + result.infilename)
+        else:
+            errors += 1
+            print("{}: {}".format(result.infilename, result.error), file=sys.stderr)
+    print("Compiled {} files into {} in {:.2f} seconds, {} errors".format(
+        count, args.outfile, time.monotonic() - starttime, errors))
+    return 1 if errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m extractor",
+                                     description="Extracts the graphics for the DOS game Isle of the Dead.")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="time the slow stages and save the timings to FILE (or set {})".format(profiler.PROFILE_ENV))
+    parser.add_argument("--profile-format", choices=profiler.FORMATS,
+                        help="json for counters and histograms or chrome for a trace (default: json)")
+    parser.add_argument("--container", metavar="FILE",
+                        help="read files from this compiled container when it has an up to date copy of them")
+    subparsers = parser.add_subparsers(dest="command")
+    export = subparsers.add_parser("export", help="export every supported file in the game folder")
+    export.add_argument("gamefolder", help="the game folder to export")
+    export.add_argument("outdir", help="the folder to write the images to")
+    export.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: one per CPU)")
+    export.add_argument("--full", action="store_true", help="export every file, even ones that haven't changed")
+    export.add_argument("--dedupe", choices=("hardlink", "json"),
+                        help="encode files with identical frames once and hard link the copies to it "
+                             "or list them in duplicates.json")
+    export.add_argument("-q", "--quiet", action="store_true", help="only report errors and the summary")
+    atlas = subparsers.add_parser("atlas", help="pack every frame of a file or folder into sprite sheets")
+    atlas.add_argument("path", help="a file, a folder or the whole game folder")
+    atlas.add_argument("outbase", help="the sheets are saved as <outbase>-<n>.png with an index in <outbase>.json")
+    atlas.add_argument("--max-size", type=int, default=2048, help="the largest sheet width and height (default: 2048)")
+    atlas.add_argument("--dedupe", action="store_true", help="store identical frames once in the sheets")
+    atlas.add_argument("-q", "--quiet", action="store_true", help="only report errors and the summary")
+    compiler = subparsers.add_parser("compile", help="decode every file in the game folder into one container file")
+    compiler.add_argument("gamefolder", help="the game folder to compile")
+    compiler.add_argument("outfile", help="the container file to write, such as game.iotd")
+    compiler.add_argument("-j", "--jobs", type=int, default=None,
+                          help="number of worker processes (default: one per CPU)")
+    compiler.add_argument("-q", "--quiet", action="store_true", help="only report errors and the summary")
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        command = _export
+    elif args.command == "atlas":
+        command = _atlas
+    elif args.command == "compile":
+        command = _compile
+    else:
+        parser.print_help()
+        return 2
+    if args.container:
+        try:
+            usecontainer(args.container)
+        except IOError as ex:
+            print("{}: {}".format(args.container, ex), file=sys.stderr)
+            return 1
+    profilefile, profileformat = profiler.start(args.profile, args.profile_format)
+    try:
+        return command(args)
+    finally:
+        if profilefile:
+            profiler.save(profilefile, profileformat)
+            print("Saved profile: " + profilefile)
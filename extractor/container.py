@@ -0,0 +1,176 @@
+#
+# Reads compiled containers: a whole game folder's decoded frames in one indexed file.
+#
+# The container starts with a fixed size header, followed by the decoded palette indexes of
+# every frame, the palettes, the file names and an index of fixed size records sorted by
+# file name. The file is memory-mapped, so opening a file from it costs a dict lookup and
+# a stat, and loading a frame points an image at the mapped pixels without decoding.
+#
+# Containers are written by exporter.compilecontainer.
+#
+
+import collections
+import mmap
+import os
+import struct
+
+from PIL import Image, ImageFile, ImagePalette
+
+CONTAINER_EXTENSION = ".iotd"
+MAGIC = b"IOTDPAK1"
+# Version 1 containers could hold CEL palettes that Pillow 5 had scrambled.
+VERSION = 2
+PALETTE_SIZE = 768
+# magic, version, entry count, palette count, flags, index offset, palette offset, names offset,
+# game folder name offset and length
+HEADER = struct.Struct("<8sIIIIQQQII")
+# name offset and length, source size, source mtime_ns, width, height, frame count,
+# duration or -1, palette number, frame data offset
+RECORD = struct.Struct("<IIQqHHIiIQ")
+
+ContainerEntry = collections.namedtuple(
+    "ContainerEntry", "relpath size mtime width height n_frames duration palette offset")
+
+
+class ContainerImageFile(ImageFile.ImageFile):
+    """
+    A file in a compiled container, opened like any other multi-frame image.
+    Frames are loaded as read-only images over the container's memory map.
+    """
+    format = "IOTDPAK"
+    format_description = "Compiled container entry"
+
+    def __init__(self, container, entry, filename):
+        self._container = container
+        self._entry = entry
+        ImageFile.ImageFile.__init__(self, None, filename)
+
+    def _open(self):
+        entry = self._entry
+        self.mode = "P"
+        self.size = entry.width, entry.height
+        self.palette = ImagePalette.raw("RGB", self._container.palettedata(entry.palette))
+        if entry.duration >= 0:
+            self.info["duration"] = entry.duration
+        self._frame = -1
+        self.seek(0)
+
+    @property
+    def n_frames(self):
+        return self._entry.n_frames
+
+    @property
+    def is_animated(self):
+        return self._entry.n_frames > 1
+
+    def seek(self, frame):
+        if frame == self._frame:
+            return
+        if not 0 <= frame < self._entry.n_frames:
+            raise EOFError("attempt to seek outside sequence")
+        self._frame = frame
+        self.tile = [("raw", (0, 0) + self.size, self._container.frameoffset(self._entry, frame),
+                      (self.mode, 0, 1))]
+
+    def tell(self):
+        return self._frame
+
+    def load(self):
+        if self.tile:
+            frame = Image.frombuffer(self.mode, self.size, self._container.framedata(self._entry, self._frame),
+                                     "raw", self.mode, 0, 1)
+            self.im = frame.im
+            self.tile = []
+            # The pixels belong to the memory map, so Pillow copies them before changing them.
+            self.readonly = 1
+            # The new image has no palette yet. Applying the same one twice scrambles it on Pillow 5.
+            self.palette = ImagePalette.raw("RGB", self._container.palettedata(self._entry.palette))
+        return ImageFile.ImageFile.load(self)
+
+
+class Container:
+    """
+    A memory-mapped compiled container.
+
+    Files are looked up by their path relative to the game folder that the container was
+    compiled from. open returns None for files that aren't in the container or have changed
+    since, so that the caller can fall back to the file itself.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+            header = self._view[:HEADER.size]
+            if len(header) != HEADER.size:
+                raise IOError("not a compiled container: " + filename)
+            (magic, version, entrycount, self._palettecount, flags, indexoffset, self._paletteoffset,
+             namesoffset, folderoffset, folderlength) = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise IOError("not a compiled container: " + filename)
+            if version != VERSION:
+                raise IOError("compiled container is from another version, compile it again: " + filename)
+            names = bytes(self._view[namesoffset:indexoffset])
+            self.gamefolder = names[folderoffset:folderoffset + folderlength].decode("utf-8")
+            index = self._view[indexoffset:indexoffset + entrycount * RECORD.size]
+            self._entries = {}
+            for record in RECORD.iter_unpack(index):
+                relpath = names[record[0]:record[0] + record[1]].decode("utf-8")
+                self._entries[relpath] = ContainerEntry(relpath, *record[2:])
+        except (ValueError, struct.error):
+            self.close()
+            raise IOError("damaged compiled container: " + filename)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        # Frames that still point into the map keep it alive until they are gone.
+        self._entries = {}
+        self._view = None
+        self._map = None
+        self._file.close()
+
+    def palettedata(self, number):
+        start = self._paletteoffset + number * PALETTE_SIZE
+        return bytes(self._view[start:start + PALETTE_SIZE])
+
+    def frameoffset(self, entry, frame):
+        return entry.offset + frame * entry.width * entry.height
+
+    def framedata(self, entry, frame):
+        """Returns a memoryview of a frame's palette indexes, row by row."""
+        start = self.frameoffset(entry, frame)
+        return self._view[start:start + entry.width * entry.height]
+
+    def _relpath(self, filename):
+        try:
+            relpath = os.path.relpath(os.path.abspath(filename), self.gamefolder)
+        except ValueError:
+            # On Windows the file is on another drive than the game folder.
+            return None
+        if relpath.startswith(os.pardir):
+            return None
+        return relpath.replace(os.sep, "/")
+
+    def open(self, filename, st=None):
+        """
+        Opens a game file from the container as an image.
+        Returns None when the file isn't in the container or its size or mtime has changed.
+        st is the file's os.stat result when the caller already has it.
+        """
+        relpath = self._relpath(filename)
+        entry = self._entries.get(relpath) if relpath else None
+        if entry is None:
+            return None
+        if st is None:
+            try:
+                st = os.stat(filename)
+            except FileNotFoundError:
+                # The container can stand in for a game folder that is no longer there.
+                pass
+        if st is not None and (st.st_size, st.st_mtime_ns) != (entry.size, entry.mtime):
+            return None
+        return ContainerImageFile(self, entry, filename)
@@ -0,0 +1,449 @@
+#
+# Exports the game's graphics.
+#
+
+import collections
+import concurrent.futures
+import hashlib
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+
+from . import profiler
+from .atlas import atlasfiles
+from .container import HEADER, MAGIC, RECORD, VERSION
+from .framestream import iterframes
+from .gifwriter import savegif
+from .imagefile import issupported, openfile, openimage, getframecount, getpalettebytes
+from .keyframes import KEYFRAME_FOLDER, sidecarfilename
+from .manifest import ExportManifest
+
+ExportResult = collections.namedtuple("ExportResult", "infilename outfilename error")
+
+
+def findfiles(gamefolder, exportfolder):
+    """
+    Yields (infilename, outfilebase) for every supported file in the game folder.
+    The output mirrors the game folder's layout without the file extension.
+    """
+    for root, dirnames, filenames in os.walk(gamefolder):
+        relpath = os.path.relpath(root, gamefolder)
+        if relpath == ".":
+            relpath = ""
+        outpath = os.path.join(exportfolder, relpath)
+        for filename in filenames:
+            if issupported(filename):
+                yield os.path.join(root, filename), os.path.join(outpath, os.path.splitext(filename)[0])
+
+
+@profiler.timed("export.file")
+def exportfile(infilename, outfilebase):
+    """
+    Exports a single file as an animated GIF when it has multiple frames or as a PNG otherwise.
+    Returns the name of the file that was written.
+    """
+    os.makedirs(os.path.dirname(outfilebase), exist_ok=True)
+    image = openimage(infilename)
+    image.load()
+    if getframecount(image) > 1:
+        outfilename = outfilebase + ".gif"
+        _removefile(outfilename)
+        savegif(image, outfilename)
+    else:
+        outfilename = outfilebase + ".png"
+        _removefile(outfilename)
+        image.save(outfilename)
+    return outfilename
+
+
+def _removefile(filename):
+    """Removes a file before it is rewritten so that any hard links to it keep the old contents."""
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+
+@profiler.timed("export.hash")
+def hashframes(infilename):
+    """
+    Returns a hash of a file's decoded frames, palettes and duration.
+    Files with the same hash export to identical images.
+    """
+    image = openimage(infilename)
+    sha1 = hashlib.sha1()
+    sha1.update(repr((image.mode, image.info.get("duration"))).encode())
+    for frame in range(getframecount(image)):
+        image.seek(frame)
+        image.load()
+        sha1.update(repr(image.size).encode())
+        sha1.update(bytes(image.getpalette() or []))
+        sha1.update(image.tobytes())
+    return sha1.hexdigest()
+
+
+def _hashtask(infilename):
+    try:
+        return hashframes(infilename)
+    except Exception:
+        # The file is exported on its own so that the error gets reported.
+        return None
+
+
+@profiler.timed("export.animation")
+def exportanimation(infilename, outfilename):
+    """Saves every frame of a file to a single animated file. Returns the name of the file that was written."""
+    image = openimage(infilename)
+    image.load()
+    if outfilename.lower().endswith(".gif"):
+        savegif(image, outfilename)
+    else:
+        image.save(outfilename, save_all=True)
+    return outfilename
+
+
+@profiler.timed("export.frames")
+def exportframes(infilename, start, outfilenames):
+    """
+    Saves consecutive frames of a file, beginning with frame `start`, to the given files.
+    FLI animations start from the keyframes that the viewer saved for them, if there are any.
+    Returns the name of the last file that was written.
+    """
+    image = openimage(infilename)
+    frames = iterframes(image, start, start + len(outfilenames), sidecarfilename(infilename, KEYFRAME_FOLDER))
+    for (frame, frameimage), outfilename in zip(frames, outfilenames):
+        frameimage.save(outfilename)
+    return outfilenames[-1]
+
+
+@profiler.timed("export.atlas")
+def exportatlas(infilename, outfilename):
+    """
+    Packs every frame of a file into sprite sheets named after outfilename with a JSON index.
+    Returns the name of the index file.
+    """
+    files, errors = atlasfiles([infilename], os.path.splitext(outfilename)[0], os.path.dirname(infilename))
+    if errors:
+        raise IOError(errors[0][1])
+    return files[-1]
+
+
+def frametasks(infilename, n_frames, outfilenames, chunks):
+    """
+    Splits saving each frame to its own file into about `chunks` exportframes tasks.
+    Each task saves a run of consecutive frames since FLI frames can only be decoded in order.
+    """
+    size = max(1, -(-n_frames // chunks))
+    return [(exportframes, infilename, start, outfilenames[start:start + size]) for start in range(0, n_frames, size)]
+
+
+def _runtask(function, infilename, *args):
+    """Runs an export function and reports errors as part of the result so that one bad file doesn't stop the export."""
+    try:
+        return ExportResult(infilename, function(infilename, *args), None)
+    except Exception as ex:
+        return ExportResult(infilename, None, str(ex))
+
+
+def _runworkertask(function, infilename, *args):
+    """Runs a task in a worker process. Returns its ExportResult and the operations that the worker timed."""
+    return _runtask(function, infilename, *args), profiler.takeevents()
+
+
+def _processpool(jobs):
+    """
+    Returns a process pool with `jobs` workers that start a fresh interpreter instead of forking.
+    A forked worker gets a copy of any lock that one of the viewer's threads was holding, and can
+    wait on it forever.
+    """
+    if sys.version_info < (3, 7):
+        # Python 3.6 can only fork.
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    return concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"))
+
+
+class ExportJob:
+    """
+    Runs export tasks on a process pool without blocking the caller.
+    Each task is a tuple of an export function, the input file name and the function's other arguments.
+    """
+
+    def __init__(self, tasks, jobs=None, manifest=None):
+        self.manifest = manifest
+        self.total = len(tasks)
+        self.completed = 0
+        self.cancelled = False
+        self._results = queue.Queue()
+        self._executor = _processpool(jobs)
+        # Maps each future to the input file name of its task.
+        self._futures = collections.OrderedDict((self._executor.submit(_runworkertask, *task), task[1])
+                                                for task in tasks)
+        for future in self._futures:
+            future.add_done_callback(self._ondone)
+        if not tasks:
+            self._shutdown()
+
+    def _ondone(self, future):
+        if not future.cancelled():
+            try:
+                result, events = future.result()
+            except Exception as ex:
+                # The worker process died, so report the task as failed instead of losing its result.
+                result, events = ExportResult(self._futures[future], None, str(ex) or type(ex).__name__), []
+            profiler.addevents(events)
+            self._results.put(result)
+
+    def _shutdown(self):
+        """
+        Stops the worker processes once every task has finished or been cancelled.
+        Shutting down any earlier closes the pool's queue under the tasks that are still waiting
+        to start in Python 3.6 to 3.8, and the job never finishes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @property
+    def finished(self):
+        finished = self.completed == self.total or (self.cancelled and all(future.done() for future in self._futures))
+        if finished:
+            self._shutdown()
+        return finished
+
+    def get(self, block=True):
+        """
+        Returns the next ExportResult, or None if block is False and nothing has finished.
+        Successful results are recorded in the manifest when there is one.
+        """
+        try:
+            result = self._results.get(block)
+        except queue.Empty:
+            return None
+        self.completed += 1
+        if self.completed == self.total:
+            self._shutdown()
+        if self.manifest is not None and result.error is None:
+            self.manifest.record(result.infilename, result.outfilename)
+        return result
+
+    def cancel(self):
+        """Cancels the tasks that haven't started yet. Running tasks still finish."""
+        self.cancelled = True
+        for future in self._futures:
+            future.cancel()
+
+
+def planexport(gamefolder, exportfolder, full=False, dedupe=None):
+    """
+    Works out which files in the game folder need exporting.
+    Unless full is True, files that are unchanged since the last export are skipped, and
+    exported files whose sources have gone away are deleted.
+    dedupe is None, "hardlink" or "json" and is recorded with the export parameters.
+    Returns the ExportManifest, the tasks to run and the names of the skipped files.
+    """
+    manifest = ExportManifest(gamefolder, exportfolder, {"dedupe": dedupe} if dedupe else None)
+    tasks = []
+    uptodate = []
+    files = list(findfiles(gamefolder, exportfolder))
+    for infilename, outfilebase in files:
+        if manifest.isuptodate(infilename, full):
+            uptodate.append((infilename, outfilebase))
+        else:
+            tasks.append((exportfile, infilename, outfilebase))
+    skipped = []
+    stale = set(manifest.stalereferences(infilename for infilename, outfilebase in uptodate))
+    for infilename, outfilebase in uptodate:
+        if infilename in stale:
+            manifest.isuptodate(infilename, True)
+            tasks.append((exportfile, infilename, outfilebase))
+        else:
+            skipped.append(infilename)
+    manifest.removevanished(infilename for infilename, outfilebase in files)
+    return manifest, tasks, skipped
+
+
+def findduplicates(tasks, manifest, jobs=None):
+    """
+    Hashes the decoded frames of each exportfile task's source across `jobs` worker processes.
+    Returns the tasks for sources with unique frames and a list of (task, canonical) for the rest,
+    where canonical is the source file with the same frames whose output they can share.
+    """
+    filenames = [task[1] for task in tasks]
+    if jobs == 1:
+        digests = [_hashtask(filename) for filename in filenames]
+    else:
+        with _processpool(jobs) as executor:
+            digests = list(executor.map(_hashtask, filenames, chunksize=16))
+    canonicals = manifest.canonicaloutputs()
+    uniquetasks = []
+    duplicates = []
+    for task, digest in zip(tasks, digests):
+        if digest is None:
+            uniquetasks.append(task)
+            continue
+        manifest.setdigest(task[1], digest)
+        if digest in canonicals:
+            duplicates.append((task, canonicals[digest]))
+        else:
+            canonicals[digest] = task[1]
+            uniquetasks.append(task)
+    return uniquetasks, duplicates
+
+
+def _linkfile(source, destination):
+    """Hard links destination to source, copying instead where links aren't supported."""
+    _removefile(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def linkduplicates(duplicates, manifest, mode):
+    """
+    Writes the duplicates found by findduplicates once their canonical files are exported.
+    With mode "hardlink" each one becomes a hard link to its canonical output. With mode "json"
+    no file is written and the manifest lists it in duplicates.json instead.
+    Yields an ExportResult for each duplicate.
+    """
+    for task, canonical in duplicates:
+        function, infilename, outfilebase = task
+        source = manifest.getoutput(canonical)
+        if source is None:
+            # The canonical file failed to export so export this one on its own.
+            result = _runtask(*task)
+            if result.error is None:
+                manifest.record(result.infilename, result.outfilename)
+            yield result
+            continue
+        if mode == "hardlink":
+            outfilename = outfilebase + os.path.splitext(source)[1]
+            try:
+                os.makedirs(os.path.dirname(outfilename), exist_ok=True)
+                _linkfile(source, outfilename)
+            except OSError as ex:
+                yield ExportResult(infilename, None, str(ex))
+                continue
+            manifest.record(infilename, outfilename, canonical)
+        else:
+            outfilename = source
+            manifest.record(infilename, outfilename, canonical, reference=True)
+        yield ExportResult(infilename, outfilename, None)
+
+
+def runtasks(tasks, jobs=None, manifest=None):
+    """
+    Runs export tasks across `jobs` worker processes, defaulting to one per CPU.
+    Yields an ExportResult for each task as it finishes.
+    """
+    if jobs == 1:
+        for task in tasks:
+            result = _runtask(*task)
+            if manifest is not None and result.error is None:
+                manifest.record(result.infilename, result.outfilename)
+            yield result
+        return
+    job = ExportJob(tasks, jobs, manifest)
+    for x in range(job.total):
+        yield job.get()
+
+
+def exportall(gamefolder, exportfolder, jobs=None, full=False, dedupe=None):
+    """
+    Exports the supported files in the game folder that changed since the last export.
+    With dedupe set to "hardlink" or "json", files with identical frames are only encoded once.
+    Returns the names of the skipped files, the number of duplicates and an iterator that runs the
+    export, yielding an ExportResult for each file as it finishes and saving the manifest at the end.
+    """
+    manifest, tasks, skipped = planexport(gamefolder, exportfolder, full, dedupe)
+    duplicates = []
+    if dedupe:
+        tasks, duplicates = findduplicates(tasks, manifest, jobs)
+    return skipped, len(duplicates), _runexport(tasks, duplicates, manifest, jobs, dedupe)
+
+
+def _runexport(tasks, duplicates, manifest, jobs, dedupe):
+    try:
+        for result in runtasks(tasks, jobs, manifest):
+            yield result
+        for result in linkduplicates(duplicates, manifest, dedupe):
+            yield result
+    finally:
+        manifest.save()
+
+
+def _decodetask(infilename):
+    """
+    Decodes every frame of a game file itself, never from a container, for compilecontainer.
+    Returns (size, mtime_ns, width, height, frame count, duration, palette, pixels) or an error message.
+    """
+    try:
+        st = os.stat(infilename)
+        image = openfile(infilename, st)
+        duration = image.info.get("duration")
+        palette = None
+        frames = []
+        for frame, frameimage in iterframes(image):
+            if palette is None:
+                palette = getpalettebytes(frameimage)
+                size = frameimage.size
+            elif frameimage.size != size:
+                raise IOError("the frames are not all the same size")
+            frames.append(frameimage.tobytes())
+        if not frames:
+            raise IOError("no frames")
+        return (st.st_size, st.st_mtime_ns, size[0], size[1], len(frames),
+                -1 if duration is None else int(duration), palette, b"".join(frames))
+    except Exception as ex:
+        return str(ex)
+
+
+def compilecontainer(gamefolder, containerfile, jobs=None):
+    """
+    Decodes every supported file in the game folder across `jobs` worker processes and writes
+    their frames, palettes, durations and names to a compiled container (see container.py).
+    The container is written to a temporary file first and only replaces containerfile when done.
+    Yields an ExportResult for each file as it is added.
+    """
+    gamefolder = os.path.abspath(gamefolder)
+    infilenames = sorted(infilename for infilename, outfilebase in findfiles(gamefolder, ""))
+    palettes = collections.OrderedDict()
+    records = []
+    tempfile = containerfile + ".tmp"
+    with open(tempfile, "wb") as f:
+        f.write(bytes(HEADER.size))
+        with _processpool(jobs) as executor:
+            if jobs == 1:
+                results = map(_decodetask, infilenames)
+            else:
+                results = executor.map(_decodetask, infilenames, chunksize=8)
+            for infilename, result in zip(infilenames, results):
+                if isinstance(result, str):
+                    yield ExportResult(infilename, None, result)
+                    continue
+                size, mtime, width, height, n_frames, duration, palette, pixels = result
+                relpath = os.path.relpath(infilename, gamefolder).replace(os.sep, "/")
+                records.append((relpath, size, mtime, width, height, n_frames, duration,
+                                palettes.setdefault(palette, len(palettes)), f.tell()))
+                f.write(pixels)
+                yield ExportResult(infilename, containerfile, None)
+        paletteoffset = f.tell()
+        for palette in palettes:
+            f.write(palette)
+        # The game folder's name comes first in the names, then each file's path.
+        namesoffset = f.tell()
+        names = bytearray(gamefolder.encode("utf-8"))
+        index = []
+        for record in sorted(records):
+            name = record[0].encode("utf-8")
+            index.append(RECORD.pack(len(names), len(name), *record[1:]))
+            names += name
+        f.write(names)
+        indexoffset = f.tell()
+        f.write(b"".join(index))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(index), len(palettes), 0, indexoffset, paletteoffset,
+                            namesoffset, 0, len(gamefolder.encode("utf-8"))))
+    os.replace(tempfile, containerfile)
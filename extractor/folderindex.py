@@ -0,0 +1,92 @@
+#
+# A persistent index of the supported files in a game folder.
+#
+
+import json
+import os
+
+from .imagefile import issupported
+
+
+class FolderIndex:
+    """
+    Remembers the subfolders and supported files of every folder in the game folder.
+
+    A folder is only listed again when its mtime changes, so walking an unchanged
+    game folder costs one stat per folder instead of a full directory scan.
+    """
+    INDEX_FILE = "folderindex.json"
+
+    def __init__(self, filename=INDEX_FILE):
+        self.filename = filename
+        self.gamefolder = None
+        self._folders = {}
+        self._dirty = False
+
+    def load(self):
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, "r") as f:
+                    index = json.load(f)
+                self.gamefolder = index["gamefolder"]
+                self._folders = index["folders"]
+            except (ValueError, KeyError):
+                # A damaged index only costs a rescan.
+                self.gamefolder = None
+                self._folders = {}
+
+    def save(self):
+        if not self._dirty:
+            return
+        with open(self.filename, "w") as f:
+            json.dump({"gamefolder": self.gamefolder, "folders": self._folders}, f)
+        self._dirty = False
+
+    def walk(self, gamefolder):
+        """
+        Works like os.walk but yields paths relative to the game folder, with "" for the
+        game folder itself, and only the supported files of each folder.
+        Changed folders are rescanned and folders that no longer exist are forgotten.
+        """
+        if gamefolder != self.gamefolder:
+            self.gamefolder = gamefolder
+            self._folders = {}
+            self._dirty = True
+        folders = {}
+        stack = [""]
+        while stack:
+            relpath = stack.pop()
+            path = os.path.join(gamefolder, relpath)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            entry = self._folders.get(relpath)
+            if entry is None or entry[0] != mtime:
+                entry = [mtime] + _scanfolder(path)
+                self._dirty = True
+            folders[relpath] = entry
+            mtime, dirnames, filenames = entry
+            yield relpath, dirnames, filenames
+            # Reversed so that subfolders are visited in order.
+            stack.extend(os.path.join(relpath, dirname) for dirname in reversed(dirnames))
+        if len(folders) != len(self._folders):
+            self._dirty = True
+        self._folders = folders
+
+
+def _scanfolder(path):
+    """Returns the sorted subfolder names and supported file names in a folder."""
+    dirnames = []
+    filenames = []
+    try:
+        for entry in os.scandir(path):
+            if entry.is_dir():
+                # Like os.walk, don't go into links to folders, which can loop back on themselves.
+                if not entry.is_symlink():
+                    dirnames.append(entry.name)
+            elif issupported(entry.name):
+                filenames.append(entry.name)
+    except OSError:
+        pass
+    return [sorted(dirnames), sorted(filenames)]
@@ -0,0 +1,94 @@
+#
+# Streams decoded frames from an image file to the exporters.
+#
+# Frames are decoded one at a time as the writer asks for them, so exporting an animation uses
+# the same memory no matter how many frames it has.
+#
+
+import queue
+import threading
+
+from PIL import FliImagePlugin
+
+from .imagefile import getframecount
+from .keyframes import KeyframeSeeker, canseek
+
+# The number of frames that bufferframes decodes ahead of the writer.
+FRAME_BUFFER_SIZE = 4
+
+# Marks the end of the frames in a bufferframes queue.
+_END = object()
+
+
+def iterframes(image, start=0, stop=None, sidecar=None):
+    """
+    Yields (frame number, image) for each frame from start up to, but not including, stop.
+    The same image object is loaded with each frame in turn, so copy it to keep a frame.
+    FLI animations start from the nearest keyframe in the sidecar file when one is given.
+    """
+    if stop is None:
+        stop = getframecount(image)
+    seeker = None
+    if start > 0 and canseek(image):
+        seeker = KeyframeSeeker(image, sidecar=sidecar)
+    elif start > 0 and isinstance(image, FliImagePlugin.FliImageFile):
+        # Each FLI frame only holds the changes to the one before it, and older versions of Pillow
+        # only decode the last frame that was seeked to, so decode every frame before start.
+        for frame in range(start):
+            image.seek(frame)
+            image.load()
+    for frame in range(start, stop):
+        if seeker is not None:
+            seeker.seek(frame)
+        else:
+            image.seek(frame)
+            image.load()
+        yield frame, image
+
+
+def bufferframes(frames, size=FRAME_BUFFER_SIZE):
+    """
+    Decodes frames from an iterframes generator on a background thread while the caller writes
+    the ones before them. At most size frames are held; decoding waits when the buffer is full.
+    Errors while decoding are raised in the caller.
+    """
+    if size <= 0:
+        yield from frames
+        return
+    buffer = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+
+    def put(item):
+        """Waits for room in the buffer. Returns False if the caller stopped first."""
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def decode():
+        try:
+            for frame, image in frames:
+                if not put((frame, image.copy())):
+                    return
+        except Exception as ex:
+            put(ex)
+            return
+        put(_END)
+
+    thread = threading.Thread(target=decode, name="bufferframes", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Stop decoding when the caller stops early.
+        stopped.set()
+        thread.join()
@@ -0,0 +1,119 @@
+#
+# Writes animated GIF files straight from paletted frames.
+#
+# The game's frames are already 256 color images that share one palette, so there is nothing
+# to quantize. The palette is written once and each frame only stores the rectangle that
+# changed since the frame before it.
+#
+
+import struct
+
+from PIL import Image, ImageChops, ImageFile
+
+from . import profiler
+from .framestream import FRAME_BUFFER_SIZE, bufferframes, iterframes
+from .imagefile import getduration, getpalettebytes
+
+# Leave the frame in place when the next one is drawn, as Pillow's own writer does. Decoders treat
+# it like "do not dispose" (1), but Pillow 5 keeps the first palette for frames marked with that.
+_DISPOSE_UNSPECIFIED = 0
+
+
+def _indexes(frame):
+    """Returns the palette indexes of a frame as an "L" image, for comparing frames."""
+    return Image.frombytes("L", frame.size, frame.tobytes())
+
+
+class GifWriter:
+    """
+    Writes paletted frames of the same size to an animated GIF file.
+
+    The first frame's palette becomes the global color table. Frames with another palette get
+    their own color table and are written whole. Frames that don't change anything are merged
+    into the frame before them by adding their delay to it.
+    loop is the number of times to repeat the animation, 0 for forever or None for no loop extension.
+    """
+
+    def __init__(self, fp, loop=None):
+        self.fp = fp
+        self.loop = loop
+        self.size = None
+        self.palette = None
+        self._previous = None
+        # The (image, position, palette, delay) of the frame that hasn't been written yet.
+        self._pending = None
+
+    def _writeheader(self):
+        width, height = self.size
+        # Global color table with 256 entries and 8 bits per primary color.
+        self.fp.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0xf7, 0, 0))
+        self.fp.write(self.palette)
+        if self.loop is not None:
+            self.fp.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", self.loop) + b"\0")
+
+    def add(self, frame, duration):
+        """Adds a "P" mode frame that is shown for duration milliseconds."""
+        if frame.mode != "P":
+            raise ValueError("GifWriter needs paletted frames, not " + frame.mode)
+        palette = getpalettebytes(frame)
+        if self.size is None:
+            self.size = frame.size
+            self.palette = palette
+            self._writeheader()
+        elif frame.size != self.size:
+            raise ValueError("every frame must be {} x {}".format(*self.size))
+        delay = int(duration / 10 + 0.5)
+        indexes = _indexes(frame)
+        if self._previous is None or palette != self._pending[2]:
+            box = (0, 0) + frame.size
+        else:
+            # Compare palette indexes, not colors, since that's what gets written.
+            box = ImageChops.difference(self._previous, indexes).getbbox()
+            if box is None:
+                image, position, pendingpalette, pendingdelay = self._pending
+                self._pending = image, position, pendingpalette, pendingdelay + delay
+                return
+        self._flush()
+        # Copy the pixels since the caller may decode the next frame into the same image.
+        image = frame.crop(box)
+        image.load()
+        self._pending = image, box[:2], palette, delay
+        self._previous = indexes
+
+    def _flush(self):
+        if self._pending is None:
+            return
+        image, (left, top), palette, delay = self._pending
+        self._pending = None
+        fp = self.fp
+        width, height = image.size
+        fp.write(b"\x21\xf9\x04" + struct.pack("<BHBB", _DISPOSE_UNSPECIFIED << 2, min(delay, 0xffff), 0, 0))
+        if palette == self.palette:
+            fp.write(b"\x2c" + struct.pack("<HHHHB", left, top, width, height, 0))
+        else:
+            fp.write(b"\x2c" + struct.pack("<HHHHB", left, top, width, height, 0x87) + palette)
+        # LZW minimum code size, then the image data as Pillow's GIF encoder writes it.
+        fp.write(b"\x08")
+        image.encoderconfig = (8, False)
+        ImageFile._save(image, fp, [("gif", (0, 0) + image.size, 0, "P")])
+        fp.write(b"\0")
+
+    def close(self):
+        """Writes the last frame and the end of the file. The file object is not closed."""
+        self._flush()
+        if self.size is not None:
+            self.fp.write(b"\x3b")
+
+
+@profiler.timed("export.gif")
+def savegif(image, outfilename, loop=None, buffersize=FRAME_BUFFER_SIZE):
+    """
+    Saves every frame of an opened paletted image to an animated GIF file.
+    Frames are decoded up to buffersize frames ahead while earlier ones are written.
+    """
+    duration = getduration(image)
+    with open(outfilename, "wb") as fp:
+        writer = GifWriter(fp, loop)
+        for frame, frameimage in bufferframes(iterframes(image), buffersize):
+            writer.add(frameimage, duration)
+        writer.close()
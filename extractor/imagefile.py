@@ -0,0 +1,128 @@
+#
+# Helpers for opening the game's image files.
+#
+
+import os
+
+import PIL
+from PIL import Image, FliImagePlugin
+
+from . import profiler
+from .container import Container
+from .pil import CelImagePlugin, PakImagePlugin
+
+SUPPORTED_EXTENSIONS = (".cel", ".fli", ".pak")
+
+# The plugin that opens each supported extension. Going straight to it skips Image.open's search
+# through every registered plugin and the plugin imports of Image.init().
+_OPENERS = {
+    ".cel": CelImagePlugin.CelImageFile,
+    ".fli": FliImagePlugin.FliImageFile,
+    ".pak": PakImagePlugin.PakImageFile,
+}
+
+# FLIC animation always has an extra "ring" frame at the end for looping before Pillow 4.3.
+_FLI_HAS_RING_FRAME = tuple(int(x) for x in PIL.__version__.split(".")[:2]) < (4, 3)
+
+# Names the compiled container that openimage reads from so that worker processes use it too.
+CONTAINER_ENV = "EXTRACTOR_CONTAINER"
+# The open Container, or None.
+_container = None
+
+
+def issupported(filename):
+    """Returns True when the file has one of the supported extensions."""
+    return filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def usecontainer(filename):
+    """
+    Makes openimage read files from a compiled container when it has an up to date copy of them.
+    Pass None to go back to reading every file itself. Raises IOError if the container can't be read.
+    """
+    global _container
+    if _container is not None:
+        _container.close()
+        _container = None
+    os.environ.pop(CONTAINER_ENV, None)
+    if filename:
+        _container = Container(filename)
+        os.environ[CONTAINER_ENV] = filename
+
+
+def getcontainer():
+    """Returns the Container that openimage reads from, or None."""
+    if _container is None and os.environ.get(CONTAINER_ENV):
+        # A worker process started by one that uses a container.
+        try:
+            usecontainer(os.environ[CONTAINER_ENV])
+        except IOError:
+            os.environ.pop(CONTAINER_ENV, None)
+    return _container
+
+
+def openfile(filename, st=None):
+    """
+    Opens a supported image file itself, never from the compiled container.
+    Supported extensions go straight to their plugin, which checks the file's signature.
+    st is the file's os.stat result when the caller already has it.
+    Anything else, including files that the plugin doesn't recognize, is left to Image.open.
+    :rtype: Image.Image
+    """
+    opener = _OPENERS.get(os.path.splitext(filename)[1].lower())
+    if opener is None:
+        return Image.open(filename)
+    try:
+        if issubclass(opener, CelImagePlugin.CelImageFile):
+            if st is None:
+                st = os.stat(filename)
+            return opener(filename, filesize=st.st_size)
+        return opener(filename)
+    except SyntaxError:
+        # Let Pillow try every plugin and report the error the usual way.
+        return Image.open(filename)
+
+
+def openimage(filename):
+    """
+    Opens a supported image file, from the compiled container when one is in use.
+    The file is only looked up once, for both the container and the plugin.
+    :rtype: Image.Image
+    """
+    with profiler.timer("image.open", file=os.path.basename(filename)):
+        container = getcontainer()
+        if container is None:
+            return openfile(filename)
+        try:
+            st = os.stat(filename)
+        except FileNotFoundError:
+            # The container can stand in for a game folder that is no longer there.
+            st = None
+        image = container.open(filename, st)
+        if image is not None:
+            return image
+        return openfile(filename, st)
+
+
+def getframecount(image):
+    """Returns the number of frames in the image."""
+    try:
+        n_frames = image.n_frames
+    except AttributeError:
+        return 1
+    if _FLI_HAS_RING_FRAME and isinstance(image, FliImagePlugin.FliImageFile):
+        n_frames -= 1
+    return n_frames
+
+
+def getpalettebytes(image):
+    """Returns the palette of a loaded "P" image as 768 bytes of RGB data."""
+    return bytes(image.getpalette() or b"")[:768].ljust(768, b"\0")
+
+
+def getduration(image, default=100):
+    """Returns the time between frames in milliseconds."""
+    duration = image.info.get("duration")
+    if duration is None:
+        return default
+    return int(duration)
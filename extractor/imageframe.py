@@ -92,6 +92,9 @@ class ImageFrame(tix.Frame):
     def open(self, filename):
         self.imageview.open(filename)
 
+    def setasset(self, asset):
+        self.imageview.setasset(asset)
+
     def clear(self):
         self.imageview.open(None)
 
@@ -148,9 +151,13 @@ class ImageFrame(tix.Frame):
         self.lastbutton.config(state=_get_button_state(0 <= self.currentframe < self.framecount - 1))
         if self.framecount >= 1:
             if self.framecount > 1:
-                self.frameinfo.set("Size {} x {}\nFrame {} of {}".
-                                   format(self.imageview.currentframeimage.width, self.imageview.currentframeimage.height,
-                                          self.currentframe + 1, self.framecount))
+                info = "Size {} x {}\nFrame {} of {}".format(
+                    self.imageview.currentframeimage.width, self.imageview.currentframeimage.height,
+                    self.currentframe + 1, self.framecount)
+                if self.isanimating:
+                    info += "\n{:.1f} of {:.1f} fps".format(self.imageview.measuredfps.get(),
+                                                            self.imageview.targetfps)
+                self.frameinfo.set(info)
             else:
                 self.frameinfo.set("Size {} x {}".
                                    format(self.imageview.currentframeimage.width, self.imageview.currentframeimage.height))
@@ -169,3 +176,4 @@ class ImageFrame(tix.Frame):
         self.playbutton.image = Resources.getimage('stop.png' if self.isanimating else 'play.png')
         self.playbutton.config(image=self.playbutton.image)
         self.tooltip.bind_widget(self.playbutton, balloonmsg=('Stop' if self.isanimating else 'Play') + ' animation')
+        self._onframechanged()
@@ -2,11 +2,16 @@
 # A widget to view images.
 #
 
+import collections
+import time
 import tkinter.tix as tix
-import PIL
-from PIL import Image, ImageTk, FliImagePlugin
+from PIL import Image, ImageTk
 from tkinter import messagebox
 
+from . import profiler
+from .asset import Asset
+from .cache import LruCache
+
 
 class ImageLabel(tix.Label):
     """
@@ -21,7 +26,18 @@ class ImageLabel(tix.Label):
     * animating - the current animation state.
     * repeatanimations - boolean to toggle animation looping
     * imagescale - the image scale. automatic sizing when 0.
+    * measuredfps - the frames per second actually shown while animating, 0 otherwise.
+
+    Frames are decoded when first displayed and cached. framecacheframes and
+    framecachebytes limit the cache for files opened afterward. None means no limit.
+    Scaled frames are also kept as ready-to-display PhotoImages until the
+    display size changes, up to rendercache.maxbytes.
+
+    Animation frames are timed from when the animation started rather than from the last frame,
+    so slow renders don't slow playback down. Frames are skipped when rendering falls behind.
     """
+    # The number of recently shown frames that measuredfps is averaged over.
+    FPS_SAMPLES = 16
 
     def __init__(self, master=None, cnf={}, **kw):
         tix.Label.__init__(self, master, cnf, **kw)
@@ -31,8 +47,20 @@ class ImageLabel(tix.Label):
         self.animating = tix.BooleanVar(value=False)
         self.repeatanimations = tix.BooleanVar(value=False)
         self.animation_speed = None
+        self.measuredfps = tix.DoubleVar(value=0.0)
+        self._animationstart = None
+        self._animationstartframe = 0
+        self._animationafterid = None
+        self._frametimes = collections.deque(maxlen=ImageLabel.FPS_SAMPLES)
+        self.asset = None
         self.frames = None
+        self.framecacheframes = None
+        self.framecachebytes = 16 * 1024 * 1024
         self.imagesize = None
+        self.imagefilter = None
+        # Tk keeps 4 bytes per pixel for a PhotoImage.
+        self.rendercache = LruCache(maxbytes=64 * 1024 * 1024,
+                                    sizeof=lambda photoimage: photoimage.width() * photoimage.height() * 4)
         self.currentframe = tix.IntVar(value=-1)
         self.n_frames = tix.IntVar(value=0)
         self.bind("<Configure>", self._resize)
@@ -41,8 +69,19 @@ class ImageLabel(tix.Label):
         self.imagescale.trace("w", self._resize)
 
     def open(self, filename):
-        """Opens an image file and preloads its frame(s)."""
+        """Opens an image file. Its frames are decoded as they are needed."""
+        asset = None
+        if filename is not None:
+            try:
+                asset = Asset(filename, self.framecacheframes, self.framecachebytes)
+            except IOError as ex:
+                messagebox.showerror("I/O Error", ex)
+        self.setasset(asset)
+
+    def setasset(self, asset):
+        """Displays an asset that has already been opened. Clears the image when asset is None."""
         # Reset values
+        self.asset = None
         self.image = None
         self.currentframe.set(-1)  # set invalid to force onframechanged to fire.
         self.n_frames.set(0)
@@ -51,36 +90,14 @@ class ImageLabel(tix.Label):
         self.animation_speed = None
         self.frames = None
         self.imagesize = None
-        if filename is None:
-            return
-        # Load image.
-        try:
-            self.image = Image.open(filename)
-        except IOError as ex:
-            messagebox.showerror("I/O Error", ex)
+        self.rendercache.clear()
+        if asset is None:
             return
-        try:
-            n_frames = self.image.n_frames
-            # FLIC animation always has an extra "ring" frame at the end for looping.
-            if isinstance(self.image, FliImagePlugin.FliImageFile) and PIL.__version__ < "4.3":
-                n_frames -= 1
-            self.n_frames.set(n_frames)
-        except AttributeError:
-            self.n_frames.set(1)
-        try:
-            self.animation_speed = self.image.info.get('duration')
-            if self.animation_speed is not None:
-                self.animation_speed = int(self.animation_speed)
-        except AttributeError:
-            pass
-        if self.animation_speed is None:
-            self.animation_speed = 100
-        # Preload all frames.
-        self.frames = []
-        for x in range(self.n_frames.get()):
-            self.image.seek(x)
-            self.image.load()
-            self.frames.append(self.image.copy())
+        self.asset = asset
+        self.image = asset.image
+        self.n_frames.set(asset.n_frames)
+        self.animation_speed = asset.duration
+        self.frames = asset.frames
         # Load first frame.
         self.currentframe.set(0)
 
@@ -95,9 +112,16 @@ class ImageLabel(tix.Label):
         w, h = self.imagesize
         if w == 0 or h == 0:
             return
-        currentimage = self.frames[self.currentframe.get()]
-        self.photoimage = ImageTk.PhotoImage(
-            currentimage.resize(self.imagesize, self.imagefilter))  # keep a reference!
+        key = (self.currentframe.get(), self.imagesize, self.imagefilter)
+        photoimage = self.rendercache.get(key)
+        if photoimage is None:
+            currentimage = self.frames[self.currentframe.get()]
+            with profiler.timer("render.resize", size=self.imagesize):
+                currentimage = currentimage.resize(self.imagesize, self.imagefilter)
+            with profiler.timer("render.photoimage"):
+                photoimage = ImageTk.PhotoImage(currentimage)
+            self.rendercache[key] = photoimage
+        self.photoimage = photoimage  # keep a reference!
         self.config(image=self.photoimage)
 
     @property
@@ -118,26 +142,67 @@ class ImageLabel(tix.Label):
             imagescale = min(self.winfo_width() / float(w), self.winfo_height() / float(h))
         else:
             imagescale = self.imagescale.get()
-        self.imagefilter = Image.NEAREST if imagescale >= 1 else Image.BICUBIC
-        self.imagesize = (int(w * imagescale), int(h * imagescale))
+        imagefilter = Image.NEAREST if imagescale >= 1 else Image.BICUBIC
+        imagesize = (int(w * imagescale), int(h * imagescale))
+        if (imagesize, imagefilter) != (self.imagesize, self.imagefilter):
+            # The cached frames are the wrong size now.
+            self.rendercache.clear()
+            self.imagefilter = imagefilter
+            self.imagesize = imagesize
         self._onframechanged()
 
-    def _animate(self, index):
+    @property
+    def targetfps(self):
+        """The frames per second that the image's frame duration asks for."""
+        return 1000.0 / self.animation_speed if self.animation_speed else 0.0
+
+    @property
+    def _period(self):
+        """The milliseconds between animation frames. FLI files can ask for 0."""
+        return max(1, self.animation_speed)
+
+    def _animate(self):
+        """Shows the frame that is due now and waits for the next frame's deadline."""
+        self._animationafterid = None
         if not self.animating.get():
             return
-        if index >= self.n_frames.get():
+        n_frames = self.n_frames.get()
+        ticks = int((time.monotonic() - self._animationstart) * 1000 // self._period)
+        index = self._animationstartframe + ticks
+        if index >= n_frames:
             if self.repeatanimations.get():
-                index = 0
+                index %= n_frames
+            elif self.currentframe.get() != n_frames - 1:
+                # Running late, so show the last frame before stopping.
+                index = n_frames - 1
             else:
                 self.animating.set(False)
                 return
+        if index != self.currentframe.get():
+            self._showanimationframe(index)
+        deadline = self._animationstart + (ticks + 1) * self._period / 1000.0
+        # Wait at least 1 ms so that Tk gets a chance to draw.
+        delay = max(1, int((deadline - time.monotonic()) * 1000 + 0.5))
+        self._animationafterid = self.after(delay, self._animate)
+
+    def _showanimationframe(self, index):
+        now = time.monotonic()
+        self._frametimes.append(now)
+        if len(self._frametimes) > 1:
+            self.measuredfps.set((len(self._frametimes) - 1) / max(now - self._frametimes[0], 1e-6))
         self.currentframe.set(index)
-        self.after(self.animation_speed, self._animate, index + 1)
 
     def _onanimatingchanged(self, *args):
+        if self._animationafterid is not None:
+            self.after_cancel(self._animationafterid)
+            self._animationafterid = None
+        self._frametimes.clear()
+        self.measuredfps.set(0.0)
         if self.animating.get():
             currentframe = self.currentframe.get()
             if currentframe == self.n_frames.get() - 1:
-                self.after(0, self._animate, 0)
-            else:
-                self.after(0, self._animate, currentframe)
+                currentframe = 0
+            self._animationstart = time.monotonic()
+            self._animationstartframe = currentframe
+            self._showanimationframe(currentframe)
+            self._animationafterid = self.after(self._period, self._animate)
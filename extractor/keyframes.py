@@ -0,0 +1,161 @@
+#
+# Fast random seeking in FLI animations.
+#
+# FLI frames are stored as changes to the frame before them, so Pillow can only reach an earlier
+# frame by decoding again from frame 0. KeyframeSeeker keeps a copy of every Nth decoded frame
+# and starts from the nearest one instead, so reaching any frame takes at most N - 1 deltas.
+# This relies on the private frame number and file offset of Pillow's FliImageFile.
+#
+
+import hashlib
+import os
+import struct
+import zlib
+
+from PIL import Image, FliImagePlugin
+
+from . import profiler
+from .imagefile import getframecount
+
+KEYFRAME_INTERVAL = 8
+# Where the viewer keeps sidecar files, relative to the working folder like folderindex.json.
+KEYFRAME_FOLDER = "keyframes"
+
+_SIDECAR_MAGIC = b"IOTDKEY1"
+# magic, source size, source mtime_ns, interval, width, height, keyframe count
+_SIDECAR_HEADER = struct.Struct("<8sQQIHHI")
+# frame, file offset of the next frame, compressed size
+_SIDECAR_ENTRY = struct.Struct("<III")
+
+
+def canseek(image):
+    """Returns True when KeyframeSeeker can seek within the image."""
+    return (isinstance(image, FliImagePlugin.FliImageFile) and
+            hasattr(image, "_FliImageFile__frame") and hasattr(image, "_FliImageFile__offset"))
+
+
+def sidecarfilename(filename, folder=KEYFRAME_FOLDER):
+    """Returns the name of the sidecar file for an animation, kept in folder."""
+    digest = hashlib.sha1(os.path.abspath(filename).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(folder, "{}-{}.keyframes".format(os.path.basename(filename), digest))
+
+
+class KeyframeSeeker:
+    """
+    Seeks to and loads frames of an FLI animation, keeping a snapshot of every `interval`th frame.
+
+    With a sidecar file name, snapshots saved by an earlier seeker are loaded if the animation
+    hasn't changed since. When writesidecar is True, the snapshots are saved to the sidecar once
+    every one of them has been taken.
+    """
+
+    def __init__(self, image, interval=KEYFRAME_INTERVAL, sidecar=None, writesidecar=False):
+        if not canseek(image):
+            raise ValueError("not an FLI animation")
+        self.image = image
+        self.interval = interval
+        self.sidecar = sidecar
+        self.writesidecar = writesidecar
+        # Maps frame numbers to (offset of the next frame, pixel data).
+        self.keyframes = {}
+        self._dirty = False
+        self._n_frames = getframecount(image)
+        if sidecar is not None:
+            self.loadsidecar()
+
+    def _sourcekey(self):
+        st = os.stat(self.image.filename)
+        return st.st_size, st.st_mtime_ns
+
+    def seek(self, frame):
+        """Seeks to a frame and loads it, decoding from the nearest snapshot at or before it."""
+        image = self.image
+        current = image.tell()
+        if image.tile:
+            # Pillow 5 only decodes the last frame that was seeked to, so load the current frame,
+            # which is frame 0 on a newly opened image, before moving past it.
+            image.load()
+            self._capture(current)
+        if frame != current:
+            keyframe = max((k for k in self.keyframes if k <= frame), default=None)
+            if keyframe is not None and (frame < current or keyframe > current):
+                self._restore(keyframe)
+                current = keyframe
+            elif frame < current:
+                image.seek(0)
+                image.load()
+                self._capture(0)
+                current = 0
+            for f in range(current + 1, frame + 1):
+                image.seek(f)
+                image.load()
+                self._capture(f)
+        image.load()
+        self._capture(frame)
+
+    def _capture(self, frame):
+        if frame % self.interval or frame in self.keyframes:
+            return
+        self.keyframes[frame] = self.image._FliImageFile__offset, self.image.tobytes()
+        self._dirty = True
+        if self.writesidecar and len(self.keyframes) == len(range(0, self._n_frames, self.interval)):
+            try:
+                self.savesidecar()
+            except OSError:
+                # The snapshots still work without the sidecar.
+                pass
+
+    def _restore(self, frame):
+        with profiler.timer("fli.keyframe", frame=frame):
+            offset, data = self.keyframes[frame]
+            image = self.image
+            im = Image.frombytes(image.mode, image.size, data).im
+            if image.im is not None:
+                # FLI animations keep one palette, so the new pixels get the one already applied.
+                # Marking the palette dirty instead applies it again, which scrambles it in Pillow 5.
+                im.putpalette("RGB", image.im.getpalette())
+            image.im = im
+            image.tile = []
+            image.readonly = 0
+            image._FliImageFile__frame = frame
+            image._FliImageFile__offset = offset
+
+    def loadsidecar(self):
+        """Loads the snapshots from the sidecar file when it matches the animation. Returns True if it did."""
+        try:
+            with open(self.sidecar, "rb") as f:
+                header = f.read(_SIDECAR_HEADER.size)
+                if len(header) != _SIDECAR_HEADER.size:
+                    return False
+                magic, size, mtime, interval, width, height, count = _SIDECAR_HEADER.unpack(header)
+                if (magic != _SIDECAR_MAGIC or (size, mtime) != self._sourcekey() or
+                        interval != self.interval or (width, height) != self.image.size):
+                    return False
+                keyframes = {}
+                for x in range(count):
+                    frame, offset, length = _SIDECAR_ENTRY.unpack(f.read(_SIDECAR_ENTRY.size))
+                    data = zlib.decompress(f.read(length))
+                    # A damaged snapshot is left out so that its frames are decoded instead.
+                    if len(data) == width * height:
+                        keyframes[frame] = offset, data
+        except (OSError, struct.error, zlib.error):
+            # A missing or damaged sidecar only costs decoding from the start.
+            return False
+        self.keyframes.update(keyframes)
+        return True
+
+    def savesidecar(self):
+        """Saves the snapshots to the sidecar file if any were taken since it was loaded."""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.sidecar) or ".", exist_ok=True)
+        size, mtime = self._sourcekey()
+        width, height = self.image.size
+        with open(self.sidecar, "wb") as f:
+            f.write(_SIDECAR_HEADER.pack(_SIDECAR_MAGIC, size, mtime, self.interval, width, height,
+                                         len(self.keyframes)))
+            for frame, (offset, data) in sorted(self.keyframes.items()):
+                data = zlib.compress(data, 1)
+                f.write(_SIDECAR_ENTRY.pack(frame, offset, len(data)))
+                f.write(data)
+        self._dirty = False
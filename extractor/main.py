@@ -1,24 +1,41 @@
+import concurrent.futures
 import os
-import PIL
-import tkinter as tk
 import tkinter.tix as tix
-import tkinter.ttk as ttk
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk, FliImagePlugin
 
-from .pil import CelImagePlugin, PakImagePlugin
+from .pil import CelImagePlugin
+from .asset import Asset, assetkey, assetsize
+from .cache import LruCache
+from .exporter import ExportJob, exportanimation, exportatlas, exportframes, frametasks, planexport
+from .manifest import ExportManifest
+from .folderindex import FolderIndex
+from .imagefile import usecontainer
 from .imageframe import ImageFrame
+from .keyframes import KEYFRAME_FOLDER
+from .performancewindow import PerformanceWindow
+from .progressdialog import ProgressDialog
 from .resources import Resources
 from .settings import Settings
 from .scrolltreeview import ScrollTreeView
+from .thumbnailgrid import ThumbnailGrid
+from .thumbnails import THUMBNAIL_FOLDER, ThumbnailCache
 from .xmlmenu import XmlMenu
 
 
+# The number of tree items inserted before giving the event loop a turn.
+_TREE_BATCH_SIZE = 500
+# The number of files on each side of the selected file to open ahead of time.
+_PREFETCH_COUNT = 2
+# The most assets kept open at once. Each one can hold a file handle and a memory map open.
+_ASSET_CACHE_ITEMS = 64
+
+
 def _allparentpaths(path):
     paths = []
     while len(path):
-        paths.insert(0, path)
+        paths.append(path)
         path = os.path.dirname(path)
+    paths.reverse()
     return paths
 
 
@@ -29,6 +46,24 @@ class MainApplication(tix.Tk):
         self.title('Isle of the Dead Graphics Extractor')
         self.tk.call('wm', 'iconbitmap', self._w, '-default', os.path.join(Resources.PATH, 'icon.ico'))
         self.settings = Settings()
+        self.folderindex = FolderIndex()
+        self.folderindex.load()
+        # Maps each folder with supported files somewhere below it to its (subfolders, files).
+        self._treefolders = {}
+        # Folders that only hold a placeholder until they are opened.
+        self._unfilledfolders = set()
+        self._treegeneration = 0
+        # Files are opened on a worker thread. Only the newest selection is decoded and shown.
+        self._decoder = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._decodefuture = None
+        self._selectiongeneration = 0
+        # Recently shown and prefetched assets by assetkey, limited by settings.assetcachesize.
+        self.assetcache = LruCache(maxitems=_ASSET_CACHE_ITEMS,
+                                   maxbytes=self.settings.assetcachesize.get() * 1024 * 1024, sizeof=assetsize)
+        self._prefetcher = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # Works out what Save All Files needs to export, which hashes every new or changed file.
+        self._planner = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._performancewindow = None
         self.protocol("WM_DELETE_WINDOW", self._onclosing)
         # Menu
         XmlMenu(self, os.path.join(Resources.PATH, "mainmenu.xml"), globals(), locals())
@@ -41,22 +76,30 @@ class MainApplication(tix.Tk):
         self.tree = scrolltree.tree
         self.tree.heading('#0', text='Files', anchor='w')
         self.tree.bind('<<TreeviewSelect>>', lambda *args: self._ontreeviewselect())
+        self.tree.bind('<<TreeviewOpen>>', lambda *args: self._ontreeviewopen())
         self.tree.bind('<Double-Button-1>', lambda *args: self._playanimation())
         scrolltree.pack(side='left', fill='y')
         # Image viewer
         self.imageviewer = ImageFrame(self)
         self.imageviewer.pack(expand=True, fill='both', padx=0, pady=0, ipadx=0, ipady=0)
+        # Thumbnails of the selected folder's files, shown in place of the image viewer.
+        self.thumbnailgrid = ThumbnailGrid(self, ThumbnailCache(THUMBNAIL_FOLDER))
+        self.thumbnailgrid.bind('<<ThumbnailSelect>>', lambda *args: self._onthumbnailselect())
+        self.thumbnailgrid.bind('<<ThumbnailOpen>>', lambda *args: self._onthumbnailopen())
         # Finish window
         self.minsize(800, 500)
         self._centerwindow(800, 500)
         # Added focus_force because Balloon widgets mess with focus.
         self.focus_force()
-        self._supportedextensions = ('.cel', '.fli', '.pak')
         self.settings.gamefolder.trace("w", lambda *args: self._loadtreeview())
         self.settings.repeatanimations.trace("w",
                             lambda *args: self.imageviewer.repeatanimations.set(self.settings.repeatanimations.get()))
         self.settings.imagescale.trace("w",
                             lambda *args: self.imageviewer.imagescale.set(self.settings.imagescale.get()))
+        self.settings.assetcachesize.trace("w",
+                            lambda *args: self.assetcache.setlimits(_ASSET_CACHE_ITEMS,
+                                                                    self.settings.assetcachesize.get() * 1024 * 1024))
+        self.settings.containerfile.trace("w", lambda *args: self._usecontainer())
         self.settings.load()
         # Force the initial load.
         self._loadtreeview()
@@ -71,6 +114,10 @@ class MainApplication(tix.Tk):
 
     def _onclosing(self):
         self.settings.save()
+        self._decoder.shutdown(wait=False)
+        self._prefetcher.shutdown(wait=False)
+        self._planner.shutdown(wait=False)
+        self.thumbnailgrid.shutdown()
         self.destroy()
 
     def setstatus(self, text):
@@ -94,9 +141,10 @@ class MainApplication(tix.Tk):
         filename = filedialog.asksaveasfilename(**options)
         # extension = [filetype[1] for filetype in options["filetypes"] if filetype[0] == options["typevariable"].get()][0]
         if filename:
-            self.imageviewer.imageview.currentframeimage.save(filename)
+            imageview = self.imageviewer.imageview
+            self._runexport("Save Image As",
+                            [(exportframes, imageview.asset.filename, imageview.currentframe.get(), [filename])])
             self.settings.exportfolder.set(os.path.dirname(filename))
-            self.setstatus("Saved: " + filename)
 
     def _saveanimationas(self):
         options = {
@@ -108,22 +156,24 @@ class MainApplication(tix.Tk):
             "filetypes": (("Animated GIF File (*.gif)", "*.gif"),
                           ("Separate PNG Files (*.png)", "*.png"),
                           ("Separate BMP Files (*.bmp)", "*.bmp"),
+                          ("Sprite Atlas with JSON Index (*.png)", "*.png"),
                           ("All Files (*.*)", "*.*")),
             "defaultextension": ".gif",
             "typevariable": self.settings.saveanimationfiletype,
         }
         filename = filedialog.asksaveasfilename(**options)
         if filename:
+            asset = self.imageviewer.imageview.asset
             if "Animated" in options["typevariable"].get():
-                self.imageviewer.imageview.image.save(filename, save_all=True)
-                self.setstatus("Saved: " + filename)
+                tasks = [(exportanimation, asset.filename, filename)]
+            elif "Atlas" in options["typevariable"].get():
+                tasks = [(exportatlas, asset.filename, filename)]
             else:
                 filename, ext = os.path.splitext(filename)
-                width = len(str(self.imageviewer.imageview.n_frames.get()))
-                for f in range(self.imageviewer.imageview.n_frames.get()):
-                    framefile = filename + "-{0:0{width}}".format(f, width=width) + ext
-                    self.imageviewer.imageview.frames[f].save(framefile)
-                    self.setstatus("Saved: " + framefile)
+                width = len(str(asset.n_frames))
+                framefiles = [filename + "-{0:0{width}}".format(f, width=width) + ext for f in range(asset.n_frames)]
+                tasks = frametasks(asset.filename, asset.n_frames, framefiles, os.cpu_count() or 1)
+            self._runexport("Save Animation As", tasks)
             self.settings.exportfolder.set(os.path.dirname(filename))
 
     def _saveall(self):
@@ -134,7 +184,8 @@ class MainApplication(tix.Tk):
         }
         exportfolder = filedialog.askdirectory(**options)
         if exportfolder:
-            if os.listdir(exportfolder):
+            # Updating an earlier export only overwrites the files that it wrote.
+            if os.listdir(exportfolder) and not ExportManifest.exists(exportfolder):
                 options = {
                     "title": "Confirmation",
                     "message": "The folder does not appear to be empty.\nExisting files may be overwritten.\nContinue?",
@@ -142,48 +193,199 @@ class MainApplication(tix.Tk):
                 if not messagebox.askyesno(**options):
                     return
             self.settings.exportfolder.set(exportfolder)
-            gamefolder = self.settings.gamefolder.get()
-            for root, dirnames, filenames in os.walk(gamefolder):
-                relpath = os.path.relpath(root, gamefolder)
-                if relpath == ".":
-                    relpath = ""
-                outpath = os.path.join(exportfolder, relpath)
-                for filename in filenames:
-                    if filename.lower().endswith(self._supportedextensions):
-                        infilename = os.path.join(root, filename)
-                        os.makedirs(outpath, exist_ok=True)
-                        outfilebase = os.path.join(outpath, os.path.splitext(filename)[0])
-                        try:
-                            image = Image.open(infilename)
-                            image.load()
-                            try:
-                                n_frames = image.n_frames
-                                if isinstance(self.image, FliImagePlugin.FliImageFile) and PIL.__version__ < "4.3":
-                                    n_frames -= 1
-                            except AttributeError:
-                                n_frames = 1
-                            if n_frames > 1:
-                                outfilebase += ".gif"
-                                image.save(outfilebase , save_all=True)
-                            else:
-                                outfilebase += ".png"
-                                image.save(outfilebase)
-                            self.setstatus("Saved: " + outfilebase)
-                        except Exception as ex:
-                            print(ex)
-            self.setstatus("Done")
+            dialog = ProgressDialog(self, "Save All Files", 0)
+            dialog.setprogress(0, "Looking for changed files...")
+            future = self._planner.submit(planexport, self.settings.gamefolder.get(), exportfolder)
+            self._pollplan(future, dialog)
+
+    def _pollplan(self, future, dialog):
+        """Starts exporting from the Tk thread once planexport has finished in the background."""
+        if not future.done():
+            self.after(100, self._pollplan, future, dialog)
+            return
+        if dialog.cancelled:
+            dialog.destroy()
+            self.setstatus("Cancelled")
+            return
+        try:
+            manifest, tasks, skipped = future.result()
+        except IOError as ex:
+            dialog.destroy()
+            messagebox.showerror("I/O Error", ex)
+            return
+        self._startexport(tasks, manifest, dialog)
+
+    def _runexport(self, title, tasks, manifest=None):
+        """Runs export tasks on a process pool while a progress dialog reports on them."""
+        self._startexport(tasks, manifest, ProgressDialog(self, title, len(tasks)))
+
+    def _startexport(self, tasks, manifest, dialog):
+        job = ExportJob(tasks, max(1, min(len(tasks), os.cpu_count() or 1)), manifest)
+        dialog.settotal(job.total)
+        dialog.oncancel = job.cancel
+        dialog.setprogress(0, "Starting...")
+        self._pollexport(job, dialog)
+
+    def _pollexport(self, job, dialog):
+        """Reports finished export tasks from the Tk thread until the job is done."""
+        status = None
+        result = job.get(block=False)
+        while result is not None:
+            if result.error is None:
+                status = "Saved: " + result.outfilename
+            else:
+                print("{}: {}".format(result.infilename, result.error))
+            result = job.get(block=False)
+        if status is not None:
+            self.setstatus(status)
+        if job.finished:
+            if job.manifest is not None:
+                job.manifest.save()
+            dialog.destroy()
+            self.setstatus("Cancelled" if job.cancelled else "Done")
+        else:
+            # Keep the "Cancelling..." message once cancel has been pressed.
+            dialog.setprogress(job.completed, None if job.cancelled else status)
+            self.after(100, self._pollexport, job, dialog)
 
     def _ontreeviewselect(self):
+        self._selectiongeneration += 1
+        if self._decodefuture is not None:
+            self._decodefuture.cancel()
+            self._decodefuture = None
         selectedpath = os.path.join(self.gamefolder, self.tree.focus())
+        if self.tree.focus() in self._treefolders:
+            self._showthumbnails(self.tree.focus())
+            self.filemenu.entryconfig("Save Image As", state='disabled')
+            self.filemenu.entryconfig("Save Animation As", state='disabled')
+            return
+        self._showimageviewer()
         if os.path.isfile(selectedpath):
-            self.imageviewer.open(selectedpath)
-            self.filemenu.entryconfig("Save Image As", state='normal')
-            self.filemenu.entryconfig("Save Animation As", state='normal' if self.imageviewer.imageview.n_frames.get() > 1 else 'disabled')
+            generation = self._selectiongeneration
+            asset = self.assetcache.get(assetkey(selectedpath))
+            if asset is not None:
+                self._showasset(asset, generation)
+                return
+            self._decodefuture = self._decoder.submit(self._openasset, selectedpath, generation)
+            self.after(10, self._checkdecode, self._decodefuture, generation)
         else:
             self.imageviewer.clear()
             self.filemenu.entryconfig("Save Image As", state='disabled')
             self.filemenu.entryconfig("Save Animation As", state='disabled')
 
+    def _showimageviewer(self):
+        if not self.imageviewer.winfo_manager():
+            self.thumbnailgrid.pack_forget()
+            self.thumbnailgrid.clear()
+            self.imageviewer.pack(expand=True, fill='both', padx=0, pady=0, ipadx=0, ipady=0)
+
+    def _showthumbnails(self, folder):
+        """Shows the thumbnails of the files in a folder of the tree in place of the image viewer."""
+        self.imageviewer.clear()
+        if self.imageviewer.winfo_manager():
+            self.imageviewer.pack_forget()
+            self.thumbnailgrid.pack(expand=True, fill='both')
+        files = self._treefolders[folder][1]
+        self.thumbnailgrid.setfiles(os.path.join(self.gamefolder, path) for path in files)
+        self.setstatus("{} files in {}".format(len(files), folder or os.path.normpath(self.gamefolder)))
+
+    def _onthumbnailselect(self):
+        self.setstatus(os.path.relpath(self.thumbnailgrid.selectedfile, self.gamefolder))
+
+    def _onthumbnailopen(self):
+        """Selects the file of the chosen thumbnail in the tree, which shows it in the image viewer."""
+        path = os.path.relpath(self.thumbnailgrid.selectedfile, self.gamefolder)
+        folder = os.path.dirname(path)
+        if folder in self._unfilledfolders:
+            self.tree.delete(*self.tree.get_children(folder))
+            self._filltreefolder(folder)
+        if folder:
+            self.tree.item(folder, open=True)
+        self._selecttreeitem(path, self._treegeneration)
+
+    def _selecttreeitem(self, path, generation):
+        if generation != self._treegeneration:
+            return
+        if not self.tree.exists(path):
+            # The folder's items are still being inserted.
+            self.after(10, self._selecttreeitem, path, generation)
+            return
+        self.tree.see(path)
+        self.tree.focus(path)
+        self.tree.selection_set(path)
+
+    def _openasset(self, filename, generation):
+        """Runs on the decoder thread. Skips selections that have already been replaced."""
+        if generation != self._selectiongeneration:
+            return None
+        return Asset(filename, self.imageviewer.imageview.framecacheframes, self.imageviewer.imageview.framecachebytes,
+                     KEYFRAME_FOLDER)
+
+    def _prefetchneighbors(self, generation):
+        """Opens the files next to the selected file in the background so that moving to them is instant."""
+        if generation != self._selectiongeneration:
+            return
+        item = self.tree.focus()
+        nextitem = previtem = item
+        for x in range(_PREFETCH_COUNT):
+            nextitem = nextitem and self.tree.next(nextitem)
+            previtem = previtem and self.tree.prev(previtem)
+            for sibling in (nextitem, previtem):
+                if sibling and sibling not in self._treefolders:
+                    self._prefetcher.submit(self._prefetch, os.path.join(self.gamefolder, sibling), generation)
+
+    def _prefetch(self, filename, generation):
+        """Runs on the prefetch thread. Opened assets go into the asset cache."""
+        if generation != self._selectiongeneration or not os.path.isfile(filename):
+            return
+        try:
+            if assetkey(filename) in self.assetcache:
+                return
+            asset = Asset(filename, self.imageviewer.imageview.framecacheframes,
+                          self.imageviewer.imageview.framecachebytes, KEYFRAME_FOLDER)
+        except Exception:
+            # Errors are reported if the file is selected.
+            return
+        self._cacheasset(asset)
+
+    def _cacheasset(self, asset):
+        """Adds an asset to the asset cache, which measures it again whenever it decodes a frame."""
+        self.assetcache[asset.key] = asset
+        asset.frames.ondecode = lambda: self.assetcache.updatesize(asset.key)
+
+    def _checkdecode(self, future, generation):
+        """Polls the decoder from the Tk thread and shows the asset when it is ready."""
+        if generation != self._selectiongeneration:
+            return
+        if not future.done():
+            self.after(10, self._checkdecode, future, generation)
+            return
+        self._decodefuture = None
+        try:
+            asset = future.result()
+        except IOError as ex:
+            self.imageviewer.clear()
+            self.filemenu.entryconfig("Save Image As", state='disabled')
+            self.filemenu.entryconfig("Save Animation As", state='disabled')
+            messagebox.showerror("I/O Error", ex)
+            return
+        self._showasset(asset, generation)
+
+    def _showasset(self, asset, generation):
+        # Adding it again makes it the most recently used.
+        self._cacheasset(asset)
+        self.imageviewer.setasset(asset)
+        self.filemenu.entryconfig("Save Image As", state='normal')
+        self.filemenu.entryconfig("Save Animation As", state='normal' if asset.n_frames > 1 else 'disabled')
+        self.after_idle(self._prefetchneighbors, generation)
+
+    def _showperformance(self):
+        if self._performancewindow is None or not self._performancewindow.winfo_exists():
+            self._performancewindow = PerformanceWindow(self)
+        else:
+            self._performancewindow.deiconify()
+            self._performancewindow.lift()
+
     def _playanimation(self):
         self.imageviewer.toggleanimation()
 
@@ -193,34 +395,94 @@ class MainApplication(tix.Tk):
         self.geometry('{}x{}+{}+{}'.format(width, height, x, y))
 
     def _loadtreeview(self):
+        # Drop any file that is still being opened.
+        self._selectiongeneration += 1
+        self._showimageviewer()
         self.imageviewer.clear()
         self.tree.delete(*self.tree.get_children())
+        # Palette files may have been added or removed since the last time.
+        CelImagePlugin.clearpalettecache()
         gamefolder = self.gamefolder
         self.filemenu.entryconfig("Save All Files", state='disabled')
+        # Stops any batched inserts that are still pending.
+        self._treegeneration += 1
+        self._treefolders = {"": ([], [])}
+        self._unfilledfolders = set()
         if gamefolder is None:
             return
-        addedfolders = []
-        files = []
-        for root, dirnames, filenames in os.walk(gamefolder):
-            root = os.path.relpath(root, gamefolder)
-            if root == ".":
-                root = ""
-            for filename in filenames:
-                if filename.lower().endswith(self._supportedextensions):
-                    if root and root not in addedfolders:
-                        lastpath = ""
-                        for path in _allparentpaths(root):
-                            if path not in addedfolders:
-                                self.tree.insert(lastpath, "end", iid=path, text=os.path.basename(path), open=False)
-                                addedfolders.append(path)
-                            lastpath = path
-                    files.append(os.path.join(root, filename))
-        for fullpath in files:
-            root, filename = os.path.split(fullpath)
-            self.tree.insert(root, 'end', iid=fullpath, text=filename)
-        if files:
+        hasfiles = False
+        for root, dirnames, filenames in self.folderindex.walk(gamefolder):
+            if not filenames:
+                continue
+            if root not in self._treefolders:
+                for path in _allparentpaths(root):
+                    if path not in self._treefolders:
+                        self._treefolders[path] = ([], [])
+                        self._treefolders[os.path.dirname(path)][0].append(path)
+            self._treefolders[root][1].extend(os.path.join(root, filename) for filename in filenames)
+            hasfiles = True
+        self.folderindex.save()
+        self._filltreefolder("")
+        if hasfiles:
             self.filemenu.entryconfig("Save All Files", state='normal')
 
+    def _ontreeviewopen(self):
+        folder = self.tree.focus()
+        if folder in self._unfilledfolders:
+            # Replace the placeholder with the folder's contents.
+            self.tree.delete(*self.tree.get_children(folder))
+            self._filltreefolder(folder)
+
+    def _filltreefolder(self, folder):
+        """Adds a folder's subfolders and files to the tree. Subfolders are filled when opened."""
+        self._unfilledfolders.discard(folder)
+        subfolders, files = self._treefolders[folder]
+        self._inserttreeitems(folder, subfolders + files, self._treegeneration, 0)
+
+    def _inserttreeitems(self, parent, items, generation, start):
+        """Inserts tree items in batches so that huge folders don't freeze the window."""
+        if generation != self._treegeneration:
+            # The tree was reloaded.
+            return
+        end = start + _TREE_BATCH_SIZE
+        for path in items[start:end]:
+            self.tree.insert(parent, 'end', iid=path, text=os.path.basename(path), open=False)
+            if path in self._treefolders:
+                self.tree.insert(path, 'end', text="...")
+                self._unfilledfolders.add(path)
+        if end < len(items):
+            self.after(1, self._inserttreeitems, parent, items, generation, end)
+
+    def _choosecontainer(self):
+        options = {
+            "title": "Open Compiled Container",
+            "parent": self,
+            "initialfile": self.settings.containerfile.get(),
+            "filetypes": (("Compiled Containers (*.iotd)", "*.iotd"),
+                          ("All Files (*.*)", "*.*")),
+        }
+        filename = filedialog.askopenfilename(**options)
+        if filename:
+            self.settings.containerfile.set(filename)
+
+    def _closecontainer(self):
+        self.settings.containerfile.set("")
+
+    def _usecontainer(self):
+        """Reads files from the compiled container in the settings, falling back to the game folder."""
+        containerfile = self.settings.containerfile.get()
+        try:
+            usecontainer(containerfile or None)
+        except IOError as ex:
+            messagebox.showerror("I/O Error", ex)
+            self.settings.containerfile.set("")
+            return
+        # Assets opened from the other source are the same, but reopen them to free the old one.
+        self.assetcache.clear()
+        self.filemenu.entryconfig("Close Compiled Container", state='normal' if containerfile else 'disabled')
+        if containerfile:
+            self.setstatus("Reading from " + os.path.normpath(containerfile))
+
     def _choosefolder(self):
         options = {
             "title": "Select the game folder",
@@ -0,0 +1,202 @@
+#
+# Records what an export wrote so that later exports can skip unchanged files.
+#
+
+import hashlib
+import json
+import os
+
+from .pil.CelImagePlugin import findpalette
+
+
+def _hashfile(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class ExportManifest:
+    """
+    The manifest.json file in an export folder.
+
+    For every exported source file it stores the source's hash, size and mtime, the hash of
+    the PALETTE.PAL it uses, the output file and the export parameters. A source is up to date
+    when all of those match and its output still exists. Size and mtime are checked first,
+    so unchanged files are not read at all.
+
+    When duplicates are removed, entries also hold the hash of the decoded frames, and a
+    duplicate names the canonical source it was linked to. Duplicates that are only
+    referenced point at the canonical output and are listed in duplicates.json.
+    """
+    MANIFEST_FILE = "manifest.json"
+    DUPLICATES_FILE = "duplicates.json"
+    # Version 2 writes GIFs with GifWriter, so exports made by version 1 are redone.
+    VERSION = 2
+
+    def __init__(self, gamefolder, exportfolder, params=None):
+        self.gamefolder = gamefolder
+        self.exportfolder = exportfolder
+        self.params = dict(params or {})
+        self.filename = os.path.join(exportfolder, ExportManifest.MANIFEST_FILE)
+        self._entries = {}
+        self._pending = {}
+        self._palettehashes = {}
+        self._dirty = False
+        self.load()
+
+    @classmethod
+    def exists(cls, exportfolder):
+        return os.path.isfile(os.path.join(exportfolder, ExportManifest.MANIFEST_FILE))
+
+    def load(self):
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, "r") as f:
+                    manifest = json.load(f)
+                if manifest.get("version") == ExportManifest.VERSION:
+                    self._entries = manifest["files"]
+            except (ValueError, KeyError):
+                # A damaged manifest only costs a full export.
+                self._entries = {}
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(self.exportfolder, exist_ok=True)
+        with open(self.filename, "w") as f:
+            json.dump({"version": ExportManifest.VERSION, "files": self._entries}, f, indent=1, sort_keys=True)
+        duplicatesfile = os.path.join(self.exportfolder, ExportManifest.DUPLICATES_FILE)
+        references = {relpath: entry["output"] for relpath, entry in self._entries.items() if entry.get("reference")}
+        if references or os.path.exists(duplicatesfile):
+            with open(duplicatesfile, "w") as f:
+                json.dump(references, f, indent=1, sort_keys=True)
+        self._dirty = False
+
+    def _relpath(self, infilename):
+        return os.path.relpath(infilename, self.gamefolder).replace(os.sep, "/")
+
+    def _palettehash(self, infilename):
+        if not infilename.lower().endswith((".cel", ".pak")):
+            return None
+        palfile = findpalette(infilename)
+        if palfile is None:
+            return None
+        if palfile not in self._palettehashes:
+            self._palettehashes[palfile] = _hashfile(palfile)
+        return self._palettehashes[palfile]
+
+    def isuptodate(self, infilename, force=False):
+        """
+        Returns True when the source's last export is still current, or always False when force is True.
+        Otherwise the source's details are kept until record() is called for its export.
+        """
+        relpath = self._relpath(infilename)
+        st = os.stat(infilename)
+        palette = self._palettehash(infilename)
+        entry = self._entries.get(relpath)
+        digest = None
+        if (not force and entry is not None and entry["params"] == self.params and entry["palette"] == palette and
+                entry["size"] == st.st_size and
+                os.path.isfile(os.path.join(self.exportfolder, entry["output"]))):
+            if entry["mtime"] == st.st_mtime_ns:
+                return True
+            # Only the mtime changed so compare the contents.
+            digest = _hashfile(infilename)
+            if digest == entry["hash"]:
+                entry["mtime"] = st.st_mtime_ns
+                self._dirty = True
+                return True
+        self._pending[infilename] = {
+            "hash": digest or _hashfile(infilename),
+            "size": st.st_size,
+            "mtime": st.st_mtime_ns,
+            "palette": palette,
+            "params": self.params,
+        }
+        return False
+
+    def record(self, infilename, outfilename, canonical=None, reference=False):
+        """
+        Records a successful export of a source that isuptodate() returned False for.
+        For a duplicate, canonical is the source file it duplicates. When reference is True,
+        outfilename is the canonical output rather than a file of its own.
+        """
+        entry = self._pending.pop(infilename)
+        entry["output"] = os.path.relpath(outfilename, self.exportfolder).replace(os.sep, "/")
+        if canonical is not None:
+            entry["canonical"] = self._relpath(canonical)
+        if reference:
+            entry["reference"] = True
+        relpath = self._relpath(infilename)
+        old = self._entries.get(relpath)
+        if old is not None and not old.get("reference") and (reference or old["output"] != entry["output"]):
+            # For example, a file that gained frames is now a GIF instead of a PNG.
+            self._removeoutput(old["output"])
+        self._entries[relpath] = entry
+        self._dirty = True
+
+    def setdigest(self, infilename, digest):
+        """Sets the hash of the decoded frames of a source that is about to be exported."""
+        self._pending[infilename]["digest"] = digest
+
+    def getoutput(self, infilename):
+        """Returns the output file recorded for a source or None."""
+        entry = self._entries.get(self._relpath(infilename))
+        if entry is None:
+            return None
+        return os.path.join(self.exportfolder, entry["output"])
+
+    def canonicaloutputs(self):
+        """
+        Returns {digest: source file} for sources that have an output of their own and
+        aren't about to be exported again, so that new duplicates can be linked to them.
+        """
+        pending = set(self._relpath(infilename) for infilename in self._pending)
+        return {entry["digest"]: os.path.join(self.gamefolder, relpath)
+                for relpath, entry in self._entries.items()
+                if "digest" in entry and "canonical" not in entry and relpath not in pending}
+
+    def stalereferences(self, infilenames):
+        """
+        Returns the duplicates among the up-to-date infilenames whose canonical source is
+        not up to date itself or no longer has the same frames, so they must be exported again.
+        """
+        infilenames = list(infilenames)
+        uptodate = set(self._relpath(infilename) for infilename in infilenames)
+        stale = []
+        for infilename in infilenames:
+            entry = self._entries[self._relpath(infilename)]
+            if "canonical" in entry:
+                canonical = self._entries.get(entry["canonical"])
+                if (entry["canonical"] not in uptodate or canonical is None or
+                        canonical.get("digest") != entry.get("digest")):
+                    stale.append(infilename)
+        return stale
+
+    def removevanished(self, infilenames):
+        """
+        Deletes the outputs of sources that are not in infilenames anymore and forgets them.
+        Returns the names of the deleted files.
+        """
+        present = set(self._relpath(infilename) for infilename in infilenames)
+        removed = []
+        for relpath in [relpath for relpath in self._entries if relpath not in present]:
+            entry = self._entries.pop(relpath)
+            self._dirty = True
+            if entry.get("reference"):
+                # The output belongs to another source.
+                continue
+            outfilename = self._removeoutput(entry["output"])
+            if outfilename is not None:
+                removed.append(outfilename)
+        return removed
+
+    def _removeoutput(self, output):
+        outfilename = os.path.join(self.exportfolder, output)
+        try:
+            os.remove(outfilename)
+        except OSError:
+            return None
+        return outfilename
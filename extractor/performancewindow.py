@@ -0,0 +1,108 @@
+#
+# A window that shows the most recent timed operations.
+#
+
+import os
+import tkinter.tix as tix
+import tkinter.ttk as ttk
+from tkinter import filedialog
+
+from . import profiler
+
+
+class PerformanceWindow(tix.Toplevel):
+    """
+    Shows the last `count` operations timed by the profiler and a summary of each kind of operation.
+    Timing can be turned on and off here, and the timings saved as JSON or a Chrome trace.
+    """
+    REFRESH_MS = 500
+
+    def __init__(self, master, count=200):
+        tix.Toplevel.__init__(self, master)
+        self.title("Performance")
+        self.count = count
+        self._eventcount = None
+        self._refreshid = None
+        self.enabled = tix.BooleanVar(value=profiler.isenabled())
+        self.enabled.trace("w", self._onenabledchanged)
+        toolbar = tix.Frame(self)
+        toolbar.pack(side='top', fill='x', padx=4, pady=4)
+        tix.Checkbutton(toolbar, text="Record timings", variable=self.enabled).pack(side='left')
+        tix.Button(toolbar, text="Save...", command=self._save).pack(side='right')
+        tix.Button(toolbar, text="Clear", command=self._clear).pack(side='right', padx=4)
+        panes = ttk.PanedWindow(self, orient='vertical')
+        panes.pack(expand=True, fill='both')
+        self.summary = self._maketree(panes, ("count", "mean", "max", "total"), 110)
+        self.summary.heading('#0', text='Operation', anchor='w')
+        self.summary.heading('count', text='Count', anchor='e')
+        self.summary.heading('mean', text='Mean (ms)', anchor='e')
+        self.summary.heading('max', text='Max (ms)', anchor='e')
+        self.summary.heading('total', text='Total (ms)', anchor='e')
+        self.recent = self._maketree(panes, ("duration", "details"), 110)
+        self.recent.heading('#0', text='Recent Operations', anchor='w')
+        self.recent.heading('duration', text='Time (ms)', anchor='e')
+        self.recent.heading('details', text='Details', anchor='w')
+        self.recent.column('details', width=240, anchor='w')
+        self.geometry("700x500")
+        self._refresh()
+
+    @staticmethod
+    def _maketree(panes, columns, width):
+        frame = tix.Frame(panes)
+        frame.grid_rowconfigure(0, weight=1)
+        frame.grid_columnconfigure(0, weight=1)
+        tree = ttk.Treeview(frame, columns=columns)
+        for column in columns:
+            tree.column(column, width=width, anchor='e', stretch=False)
+        scrollbar = ttk.Scrollbar(frame, orient='vertical', command=tree.yview)
+        tree.configure(yscroll=scrollbar.set)
+        tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar.grid(row=0, column=1, sticky='ns')
+        panes.add(frame, weight=1)
+        return tree
+
+    def _onenabledchanged(self, *args):
+        if self.enabled.get():
+            profiler.enable()
+        else:
+            profiler.disable()
+
+    def _refresh(self):
+        """Shows operations recorded since the last refresh, then checks again shortly."""
+        if profiler.eventcount() != self._eventcount:
+            self._eventcount = profiler.eventcount()
+            self.summary.delete(*self.summary.get_children())
+            for name, stats in sorted(profiler.summary().items()):
+                self.summary.insert('', 'end', text=name, values=(
+                    stats.count,
+                    "{:.2f}".format(stats.mean * 1000),
+                    "{:.2f}".format(stats.max * 1000),
+                    "{:.1f}".format(stats.total * 1000)))
+            self.recent.delete(*self.recent.get_children())
+            for event in reversed(profiler.recentevents(self.count)):
+                details = ", ".join("{}={}".format(key, value) for key, value in sorted((event.args or {}).items()))
+                self.recent.insert('', 'end', text=event.name, values=("{:.2f}".format(event.duration * 1000), details))
+        self._refreshid = self.after(PerformanceWindow.REFRESH_MS, self._refresh)
+
+    def destroy(self):
+        if self._refreshid is not None:
+            self.after_cancel(self._refreshid)
+            self._refreshid = None
+        tix.Toplevel.destroy(self)
+
+    def _clear(self):
+        profiler.clear()
+
+    def _save(self):
+        options = {
+            "title": "Save Timings As",
+            "parent": self,
+            "defaultextension": ".json",
+            "filetypes": (("Counters and Histograms (*.json)", "*.json"),
+                          ("Chrome Trace (*.json)", "*.json")),
+            "typevariable": tix.StringVar(self),
+        }
+        filename = filedialog.asksaveasfilename(**options)
+        if filename:
+            profiler.save(filename, "chrome" if "Chrome" in options["typevariable"].get() else "json")
+            self.master.setstatus("Saved: " + os.path.normpath(filename))
@@ -4,6 +4,59 @@
 
 from PIL import Image, ImageFile, ImagePalette
 import os
+from .. import profiler
+
+# The PALETTE.PAL file used by each folder, or None when it doesn't have one.
+_palettefiles = {}
+# The (mtime, palette data) loaded from each PALETTE.PAL file.
+_palettes = {}
+
+
+def _vgapalette(data):
+    """Converts 6-bit VGA palette data to 8-bit RGB palette data."""
+    return bytes([x * 4 for x in data])
+
+
+def findpalette(filename):
+    """
+    Returns the PALETTE.PAL file for an image file or None when there isn't one.
+    It should be in the same folder as the image file or one folder up.
+    Results are cached for each folder until clearpalettecache is called.
+    """
+    folder = os.path.dirname(filename)
+    try:
+        return _palettefiles[folder]
+    except KeyError:
+        pass
+    palfile = os.path.join(folder, "PALETTE.PAL")
+    if not os.path.isfile(palfile):
+        # check one director up for the palette file
+        palfile = os.path.join(os.path.dirname(folder), "PALETTE.PAL")
+        if not os.path.isfile(palfile):
+            palfile = None
+    _palettefiles[folder] = palfile
+    return palfile
+
+
+def getpalettedata(palfile):
+    """
+    Returns the 8-bit RGB palette data in a PALETTE.PAL file.
+    The data is cached and only read again when the file's mtime changes.
+    """
+    mtime = os.stat(palfile).st_mtime
+    cached = _palettes.get(palfile)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(palfile, "rb") as f:
+        data = _vgapalette(f.read(768))
+    _palettes[palfile] = mtime, data
+    return data
+
+
+def clearpalettecache():
+    """Forgets every cached palette file and palette."""
+    _palettefiles.clear()
+    _palettes.clear()
 
 
 class CelImageFile(ImageFile.ImageFile):
@@ -13,9 +66,20 @@ class CelImageFile(ImageFile.ImageFile):
     TOP = 0
     LEFT = 1  # Requires a square image to work correctly.
 
+    def __init__(self, fp=None, filename=None, filesize=None):
+        # The size of the file when the caller has already looked it up, as openimage does.
+        # openimage only opens files with the plugin's extension, so it isn't checked again.
+        self._filesize = filesize
+        ImageFile.ImageFile.__init__(self, fp, filename)
+
+    def _getfilesize(self):
+        if self._filesize is None:
+            self._filesize = os.stat(self.filename).st_size
+        return self._filesize
+
     def _open(self):
         # Must have .cel as the extension.
-        if os.path.splitext(self.filename)[1].lower() != ".cel":
+        if self._filesize is None and os.path.splitext(self.filename)[1].lower() != ".cel":
             raise SyntaxError("not a CEL file")
         self.mode = "P"
         data = self.fp.read(2)
@@ -26,10 +90,11 @@ class CelImageFile(ImageFile.ImageFile):
             self.fp.seek(0x20)
             self.loadvgapalette(self.fp)
             self.size = width, height
-            self.tile = [("raw", (0, 0) + self.size, 0x320, CelImageFile.TOP)]
+            self._orientation = CelImageFile.TOP
+            self.tile = [("raw", (0, 0) + self.size, 0x320, (self.mode, 0, 1))]
         else:
             # This format must have a file size of 4096 (64x64).
-            filesize = os.stat(self.filename).st_size
+            filesize = self._getfilesize()
             if filesize == 4096:
                 self.size = 64, 64
             elif filesize == 4160:  # CAVETOJ2.CEL in V1.29
@@ -39,7 +104,8 @@ class CelImageFile(ImageFile.ImageFile):
             else:
                 raise SyntaxError("not a CEL file")
             self.loadpalette()
-            self.tile = [("raw", (0, 0) + self.size, 0, CelImageFile.LEFT)]
+            self._orientation = CelImageFile.LEFT
+            self.tile = [("raw", (0, 0) + self.size, 0, (self.mode, 0, 1))]
 
     def loadvgapalette(self, fp):
         """
@@ -47,42 +113,53 @@ class CelImageFile(ImageFile.ImageFile):
         This can be either within the CEL file itself or from an
         external file.
         """
-        pal = [x * 4 for x in fp.read(768)]
-        self.palette = ImagePalette.raw("RGB", bytes(pal))
+        self._palettedata = _vgapalette(fp.read(768))
+        self.resetpalette()
 
+    @profiler.timed("cel.palette")
     def loadpalette(self):
         """
         Loads the palette from an external file.
         PALETTE.PAL must exist in the same folder as the CEL file.
         """
-        # There should be a PALETTE.PAL file in the same folder as the image file.
-        palfile = os.path.join(os.path.dirname(self.filename), "PALETTE.PAL")
-        if not os.path.isfile(palfile):
-            # check one director up for the palette file
-            palfile = os.path.join(os.path.dirname(os.path.dirname(self.filename)), "PALETTE.PAL")
-            if not os.path.isfile(palfile):
-                # This is a hard error to stop Image from trying other file formats.
-                raise IOError("Could not find PALETTE.PAL.")
-        with open(palfile, "rb") as f:
-            self.loadvgapalette(f)
+        data = None
+        palfile = findpalette(self.filename)
+        if palfile is not None:
+            try:
+                data = getpalettedata(palfile)
+            except OSError:
+                # The palette file has gone away since it was found so look for it again next time.
+                _palettefiles.pop(os.path.dirname(self.filename), None)
+        if data is None:
+            # This is a hard error to stop Image from trying other file formats.
+            raise IOError("Could not find PALETTE.PAL.")
+        self._palettedata = data
+        self.resetpalette()
 
+    def resetpalette(self):
+        """
+        Gives the image a new wrapper around its palette data, which Pillow applies to the pixels
+        once when loading finishes. Call this whenever the pixels are replaced with new ones.
+        Pillow changes the palette object when it applies it, and applying the same one again
+        scrambles the colors in Pillow 5, so setting palette.dirty isn't enough.
+        """
+        self.palette = ImagePalette.raw("RGB", self._palettedata)
+
+    @profiler.timed("cel.decode")
     def load(self):
         """Loads the image data."""
-        if self.tile is None:
-            raise IOError("Cannot load this image")
-        if not self.tile:
-            return
-        decoder_name, extents, offset, orientation = self.tile[0]
-        self.fp.seek(offset)
-        data = self.fp.read(self.width * self.height)
-        if orientation == CelImageFile.LEFT:
-            data = bytes([x for y in [data[z::self.width] for z in range(self.width)] for x in y])
-            self.size = (self.height, self.width)
-        self.im = Image.core.new(self.mode, self.size)
-        # Need to set the palette for the new image.
-        self.im.putpalette(*self.palette.getdata())
-        self.frombytes(data)
-        self.tile = []
+        return ImageFile.ImageFile.load(self)
+
+    def load_end(self):
+        """
+        Column-major data is decoded as rows and then transposed in a single pass.
+        This runs before Pillow applies the palette, so the palette is applied to the transposed pixels.
+        """
+        if self._orientation == CelImageFile.LEFT:
+            self.im = self.im.transpose(Image.TRANSPOSE)
+            self.size = self.im.size
+            self.readonly = 0
+            self.resetpalette()
 
 
 #
@@ -2,9 +2,12 @@
 # PAK file handler for Pillow.
 #
 
-from PIL import Image, ImageFile, ImagePalette
+from PIL import Image
+import io
+import mmap
 import os
 from .CelImagePlugin import CelImageFile
+from .. import profiler
 
 
 class PakImageFile(CelImageFile):
@@ -12,23 +15,40 @@ class PakImageFile(CelImageFile):
     Image plugin for PAK graphic files used by the game Isle of the Dead V1.29.
 
     These files group a bunch of column-major CEL images together.
+
+    When usemmap is True, the file is memory-mapped once and each frame is read
+    from a memoryview slice of the mapping instead of a seek and read per frame.
     """
     format = "PAK"
     format_description = "PAK raster image"
+    # Keep the file open so that other frames can be loaded.
+    _close_exclusive_fp_after_loading = False
+    FRAME_SIZE = 4096
+    usemmap = True
 
     def _open(self):
         # Must have .pak as the extension.
-        if os.path.splitext(self.filename)[1].lower() != ".pak":
+        if self._filesize is None and os.path.splitext(self.filename)[1].lower() != ".pak":
             raise SyntaxError("not a PAK file")
         # This format must have a file size of 4096 (64x64).
-        filesize = os.stat(self.filename).st_size
-        if filesize % 4096 != 0:
+        filesize = self._getfilesize()
+        if filesize % PakImageFile.FRAME_SIZE != 0:
             raise SyntaxError("not a PAK file")
-        self._frameocunt = filesize // 4096
+        self._frameocunt = filesize // PakImageFile.FRAME_SIZE
         self._frame = -1
+        # Loading a frame releases self.fp so keep a reference for seeking.
+        self._fp = self.fp
+        self._view = None
+        if self.usemmap:
+            try:
+                self._view = memoryview(mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ))
+            except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+                # Not a real file, so fall back to reading each frame.
+                pass
         self.mode = "P"
         self.loadpalette()
         self.size = (64, 64)
+        self._orientation = CelImageFile.LEFT
         #
         self.seek(0)
 
@@ -48,7 +68,35 @@ class PakImageFile(CelImageFile):
         if frame >= self._frameocunt:
             raise EOFError("no more images in PAK file")
         self._frame = frame
-        self.tile = [("raw", (0, 0) + self.size, frame * 4096, CelImageFile.LEFT)]
+        self.fp = self._fp
+        self.tile = [("raw", (0, 0) + self.size, frame * PakImageFile.FRAME_SIZE, (self.mode, 0, 1))]
+
+    def framedata(self, frame):
+        """
+        Returns the raw column-major data for a frame.
+        This is a memoryview of the mapped file when memory-mapping is in use.
+        """
+        if not 0 <= frame < self._frameocunt:
+            raise EOFError("no more images in PAK file")
+        offset = frame * PakImageFile.FRAME_SIZE
+        if self._view is not None:
+            return self._view[offset:offset + PakImageFile.FRAME_SIZE]
+        self._fp.seek(offset)
+        return self._fp.read(PakImageFile.FRAME_SIZE)
+
+    @profiler.timed("pak.decode")
+    def load(self):
+        """Loads the current frame, straight from the mapped file when possible."""
+        if self.tile and self._view is not None:
+            frame = Image.frombuffer(self.mode, self.size, self.framedata(self._frame), "raw", self.mode, 0, 1)
+            self.im = frame.im.transpose(Image.TRANSPOSE)
+            self.tile = []
+            self.readonly = 0
+            # Loading finishes by applying the palette to the new pixels.
+            self.resetpalette()
+        return CelImageFile.load(self)
+
+
 #
 # Register
 #
@@ -0,0 +1,4 @@
+# Importing the package registers the game's formats with Pillow.
+from . import CelImagePlugin, PakImagePlugin
+
+__all__ = ["CelImagePlugin", "PakImagePlugin"]
@@ -0,0 +1,247 @@
+#
+# Lightweight timing for the slow stages of opening, showing and exporting images.
+#
+# Timing is off, and costs one flag check per stage, unless enable() is called or the
+# EXTRACTOR_PROFILE environment variable names a file to save the timings to.
+#
+
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+PROFILE_ENV = "EXTRACTOR_PROFILE"
+FORMAT_ENV = "EXTRACTOR_PROFILE_FORMAT"
+FORMATS = ("json", "chrome")
+# The number of most recent operations that are kept for traces and the Performance window.
+MAX_EVENTS = 100000
+# The upper bounds of the histogram buckets in milliseconds. Slower operations go in one more bucket.
+HISTOGRAM_BOUNDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# start and duration are in seconds. args is a dict of details or None.
+Event = collections.namedtuple("Event", "name start duration pid tid args")
+
+_enabled = bool(os.environ.get(PROFILE_ENV))
+_lock = threading.Lock()
+_events = collections.deque(maxlen=MAX_EVENTS)
+_stats = {}
+# The number of operations recorded since the last clear, including ones that no longer fit in _events.
+_count = 0
+
+
+class OperationStats:
+    """The count, total, fastest and slowest times and histogram of one kind of operation."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if self.min is None or duration < self.min:
+            self.min = duration
+        if self.max is None or duration > self.max:
+            self.max = duration
+        milliseconds = duration * 1000
+        bucket = 0
+        while bucket < len(HISTOGRAM_BOUNDS) and milliseconds > HISTOGRAM_BOUNDS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def asdict(self):
+        """Returns the stats in milliseconds, ready for JSON."""
+        labels = ["<={}ms".format(bound) for bound in HISTOGRAM_BOUNDS]
+        labels.append(">{}ms".format(HISTOGRAM_BOUNDS[-1]))
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.mean * 1000,
+            "min_ms": (self.min or 0.0) * 1000,
+            "max_ms": (self.max or 0.0) * 1000,
+            "histogram": collections.OrderedDict(zip(labels, self.histogram)),
+        }
+
+
+class _Timer:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, self.start, time.perf_counter() - self.start, self.args)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def isenabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def clear():
+    """Forgets every recorded operation."""
+    global _count
+    with _lock:
+        _events.clear()
+        _stats.clear()
+        _count = 0
+
+
+def start(filename=None, format=None):
+    """
+    Turns on timing when filename is given or the EXTRACTOR_PROFILE environment variable names a file.
+    The variables are set for worker processes so that they time themselves too.
+    Returns the (filename, format) to pass to save when done, or (None, None) when timing stays off.
+    """
+    filename = filename or os.environ.get(PROFILE_ENV)
+    if not filename:
+        return None, None
+    format = format or os.environ.get(FORMAT_ENV) or "json"
+    if format not in FORMATS:
+        raise ValueError("unknown profile format: " + format)
+    os.environ[PROFILE_ENV] = filename
+    os.environ[FORMAT_ENV] = format
+    enable()
+    return filename, format
+
+
+def timer(name, **args):
+    """
+    Returns a context manager that records how long its block takes as an operation called name.
+    Keyword arguments are kept as details of the operation.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, args or None)
+
+
+def timed(name):
+    """Decorates a function so that each call is recorded as an operation called name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Timer(name, None):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name, start, duration, args=None):
+    """Records an operation that started at time.perf_counter() start and took duration seconds."""
+    addevents([Event(name, start, duration, os.getpid(), threading.get_ident(), args)])
+
+
+def addevents(events):
+    """Records operations, such as the ones that takeevents returned in a worker process."""
+    global _count
+    with _lock:
+        for event in events:
+            _events.append(event)
+            stats = _stats.get(event.name)
+            if stats is None:
+                stats = _stats[event.name] = OperationStats()
+            stats.add(event.duration)
+            _count += 1
+
+
+def takeevents():
+    """Removes and returns the operations recorded by this process so that they can be sent elsewhere."""
+    pid = os.getpid()
+    with _lock:
+        # A forked worker also starts with a copy of its parent's operations. Leave those behind.
+        events = [event for event in _events if event.pid == pid]
+        _events.clear()
+    return events
+
+
+def eventcount():
+    """Returns the number of operations recorded since the last clear."""
+    return _count
+
+
+def recentevents(count=None):
+    """Returns the most recent operations, oldest first."""
+    with _lock:
+        events = list(_events)
+    if count is not None:
+        events = events[-count:]
+    return events
+
+
+def summary():
+    """Returns the OperationStats of each kind of operation by name."""
+    with _lock:
+        return dict(_stats)
+
+
+def writejson(filename):
+    """Writes the counters and histograms of each kind of operation."""
+    operations = {name: stats.asdict() for name, stats in summary().items()}
+    with open(filename, "w") as f:
+        json.dump({"operations": operations}, f, indent=1, sort_keys=True)
+
+
+def writetrace(filename):
+    """Writes the recent operations in the Chrome trace event format used by chrome://tracing and Perfetto."""
+    traceevents = []
+    for event in recentevents():
+        traceevent = {
+            "name": event.name,
+            "cat": event.name.split(".")[0],
+            "ph": "X",
+            "ts": event.start * 1000000,
+            "dur": event.duration * 1000000,
+            "pid": event.pid,
+            "tid": event.tid,
+        }
+        if event.args:
+            traceevent["args"] = event.args
+        traceevents.append(traceevent)
+    with open(filename, "w") as f:
+        json.dump({"traceEvents": traceevents, "displayTimeUnit": "ms"}, f)
+
+
+def save(filename, format="json"):
+    """Writes the recorded operations in one of FORMATS."""
+    if format == "chrome":
+        writetrace(filename)
+    else:
+        writejson(filename)
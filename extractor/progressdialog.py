@@ -0,0 +1,68 @@
+#
+# A window that shows the progress of a background job.
+#
+
+import time
+import tkinter.tix as tix
+import tkinter.ttk as ttk
+
+
+def _formatseconds(seconds):
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "{}:{:02}:{:02}".format(hours, minutes, seconds)
+    return "{}:{:02}".format(minutes, seconds)
+
+
+class ProgressDialog(tix.Toplevel):
+    """
+    Shows a progress bar, the number of files per second, the time remaining and a cancel button.
+    The dialog is not modal so the rest of the application stays usable.
+    oncancel is called when cancel is pressed and can be changed or None. cancelled is True after that.
+    """
+
+    def __init__(self, master, title, total, oncancel=None):
+        tix.Toplevel.__init__(self, master)
+        self.title(title)
+        self.transient(master)
+        self.resizable(False, False)
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.total = total
+        self.oncancel = oncancel
+        self.cancelled = False
+        self._starttime = time.monotonic()
+        self.status = tix.StringVar(value="")
+        self.rate = tix.StringVar(value="")
+        tix.Label(self, textvariable=self.status, anchor='w', width=60).pack(fill='x', padx=8, pady=(8, 0))
+        self.progressbar = ttk.Progressbar(self, orient='horizontal', length=400, mode='determinate', maximum=max(total, 1))
+        self.progressbar.pack(fill='x', padx=8, pady=4)
+        tix.Label(self, textvariable=self.rate, anchor='w').pack(fill='x', padx=8)
+        self.cancelbutton = tix.Button(self, text="Cancel", command=self.cancel)
+        self.cancelbutton.pack(side='right', padx=8, pady=8)
+
+    def settotal(self, total):
+        """Changes the number of items, for jobs that only know it once they start. The rate starts again."""
+        self.total = total
+        self._starttime = time.monotonic()
+        self.progressbar.config(maximum=max(total, 1))
+
+    def setprogress(self, completed, status=None):
+        """Updates the progress bar, rate and remaining time after `completed` of the total items are done."""
+        if status is not None:
+            self.status.set(status)
+        self.progressbar.config(value=completed)
+        elapsed = time.monotonic() - self._starttime
+        if completed and elapsed > 0:
+            rate = completed / elapsed
+            self.rate.set("{} of {} files, {:.1f} files/s, {} remaining".format(
+                completed, self.total, rate, _formatseconds((self.total - completed) / rate)))
+        else:
+            self.rate.set("{} of {} files".format(completed, self.total))
+
+    def cancel(self):
+        self.cancelbutton.config(state='disabled')
+        self.status.set("Cancelling...")
+        self.cancelled = True
+        if self.oncancel is not None:
+            self.oncancel()
@@ -20,6 +20,10 @@ class Settings:
         self.imagescale = tk.IntVar(value=0)
         self.saveimagefiletype = tk.StringVar(value="")
         self.saveanimationfiletype = tk.StringVar(value="")
+        # Memory for recently viewed files in megabytes.
+        self.assetcachesize = tk.IntVar(value=256)
+        # The compiled container to read files from, or "" to read the game folder.
+        self.containerfile = tk.StringVar(value="")
         # self.load()
 
     def load(self):
@@ -39,6 +43,8 @@ class Settings:
             "imagescale": self.imagescale.get(),
             'saveimagefiletype': self.saveimagefiletype.get(),
             'saveanimationfiletype': self.saveanimationfiletype.get(),
+            "assetcachesize": self.assetcachesize.get(),
+            "containerfile": self.containerfile.get(),
         }
         return settings
 
@@ -51,3 +57,6 @@ class Settings:
         self.imagescale.set(settings.get("imagescale", 0))
         self.saveimagefiletype.set(settings.get("saveimagefiletype", ""))
         self.saveanimationfiletype.set(settings.get("saveanimationfiletype", ""))
+        self.assetcachesize.set(settings.get("assetcachesize", 256))
+        containerfile = settings.get("containerfile", "")
+        self.containerfile.set(containerfile if containerfile and os.path.isfile(containerfile) else "")
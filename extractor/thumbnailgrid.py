@@ -0,0 +1,217 @@
+#
+# A widget that shows thumbnails of many image files at once.
+#
+
+import concurrent.futures
+import os
+import tkinter.tix as tix
+from PIL import ImageTk
+
+from .cache import LruCache
+from .scrolltreeview import Scrollbar
+from .thumbnails import ThumbnailCache
+
+
+class ThumbnailGrid(tix.Frame):
+    """
+    A scrolling grid of thumbnails, like a contact sheet.
+
+    Only the cells in view are drawn. Their thumbnails come from the thumbnail cache, or are made
+    on a pool of worker threads, so showing a folder costs as many decodes as there are cells on
+    screen. Thumbnails of cells that scroll out of view before they start are not made.
+
+    Clicking a cell selects it and generates <<ThumbnailSelect>>. Double-clicking a cell or
+    pressing Return generates <<ThumbnailOpen>>. selectedfile holds the file name of the cell.
+    """
+    CELL_PADDING = 8
+    TEXT_HEIGHT = 16
+    # How often finished thumbnails are checked for.
+    POLL_MS = 20
+
+    def __init__(self, master=None, cache=None, workers=None, maxphotos=1024, cnf={}, **kw):
+        tix.Frame.__init__(self, master, cnf, **kw)
+        self.config(borderwidth=0)
+        self.cache = cache or ThumbnailCache()
+        self.filenames = []
+        self.selectedfile = None
+        self._columns = 1
+        # Maps the index of each drawn cell to its canvas image item.
+        self._cells = {}
+        # Maps file names to the futures of the thumbnails being made.
+        self._pending = {}
+        self._failed = set()
+        self._photos = LruCache(maxitems=maxphotos)
+        self._pollid = None
+        self._layoutid = None
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.canvas = tix.Canvas(self, background="#333", borderwidth=0, highlightthickness=0,
+                                 takefocus=True, yscrollincrement=self.cellheight // 4)
+        self.vscrollbar = Scrollbar(self, orient='vertical', command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._onscroll)
+        self.canvas.grid(row=0, column=0, sticky='nsew')
+        self.vscrollbar.grid(row=0, column=1, sticky='ns')
+        self.canvas.bind("<Configure>", lambda *args: self._onresize())
+        self.canvas.bind("<Button-1>", self._onclick)
+        self.canvas.bind("<Double-Button-1>", self._ondoubleclick)
+        self.canvas.bind("<Return>", lambda *args: self._open())
+        self.canvas.bind("<MouseWheel>", lambda event: self.canvas.yview_scroll(-1 if event.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda *args: self.canvas.yview_scroll(-1, "units"))
+        self.canvas.bind("<Button-5>", lambda *args: self.canvas.yview_scroll(1, "units"))
+
+    @property
+    def cellwidth(self):
+        return self.cache.size + 2 * ThumbnailGrid.CELL_PADDING
+
+    @property
+    def cellheight(self):
+        return self.cache.size + ThumbnailGrid.TEXT_HEIGHT + 2 * ThumbnailGrid.CELL_PADDING
+
+    def setfiles(self, filenames):
+        """Shows thumbnails of a list of files, scrolled to the top."""
+        for future in self._pending.values():
+            future.cancel()
+        self._pending = {}
+        self._failed = set()
+        self.filenames = list(filenames)
+        self.selectedfile = None
+        self._clearcells()
+        self._updatescrollregion()
+        self.canvas.yview_moveto(0)
+        self._layout()
+
+    def clear(self):
+        self.setfiles([])
+
+    def shutdown(self):
+        """Stops making thumbnails. Call this before the program exits."""
+        for future in self._pending.values():
+            future.cancel()
+        self._pool.shutdown(wait=False)
+
+    def _clearcells(self):
+        self.canvas.delete("all")
+        self._cells = {}
+
+    def _updatescrollregion(self):
+        rows = -(-len(self.filenames) // self._columns)
+        self.canvas.configure(scrollregion=(0, 0, self._columns * self.cellwidth, rows * self.cellheight))
+
+    def _onresize(self):
+        columns = max(1, self.canvas.winfo_width() // self.cellwidth)
+        if columns != self._columns:
+            # Every cell moves, so draw them again.
+            self._columns = columns
+            self._clearcells()
+            self._updatescrollregion()
+        self._schedulelayout()
+
+    def _onscroll(self, first, last):
+        self.vscrollbar.set(first, last)
+        self._schedulelayout()
+
+    def _schedulelayout(self):
+        # Scrolling calls this many times in a row. Only lay out once.
+        if self._layoutid is None:
+            self._layoutid = self.after_idle(self._layout)
+
+    def _visiblecells(self):
+        """Returns the range of the indexes of the cells that are at least partly in view."""
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(0, int(top // self.cellheight)) * self._columns
+        last = (int(bottom // self.cellheight) + 1) * self._columns
+        return range(first, min(last, len(self.filenames)))
+
+    def _layout(self):
+        """Draws the cells that came into view and forgets the ones that left it."""
+        self._layoutid = None
+        visible = self._visiblecells()
+        for index in [index for index in self._cells if index not in visible]:
+            self.canvas.delete("cell{}".format(index))
+            del self._cells[index]
+        wanted = set()
+        for index in visible:
+            filename = self.filenames[index]
+            wanted.add(filename)
+            if index not in self._cells:
+                self._drawcell(index)
+        # Thumbnails that haven't been started yet are no longer needed.
+        for filename in [filename for filename in self._pending if filename not in wanted]:
+            if self._pending[filename].cancel():
+                del self._pending[filename]
+
+    def _drawcell(self, index):
+        filename = self.filenames[index]
+        tag = "cell{}".format(index)
+        row, column = divmod(index, self._columns)
+        left, top = column * self.cellwidth, row * self.cellheight
+        padding = ThumbnailGrid.CELL_PADDING
+        selected = filename == self.selectedfile
+        self.canvas.create_rectangle(left + 2, top + 2, left + self.cellwidth - 2, top + self.cellheight - 2,
+                                     outline="#69f" if selected else "", fill="#246" if selected else "",
+                                     tags=(tag, "frame"))
+        self._cells[index] = self.canvas.create_image(left + self.cellwidth // 2,
+                                                      top + padding + self.cache.size // 2, tags=(tag,))
+        self.canvas.create_text(left + self.cellwidth // 2, top + padding + self.cache.size + 2,
+                                anchor='n', text=os.path.basename(filename), fill="#ddd",
+                                width=self.cellwidth - 4, tags=(tag,))
+        photo = self._photos.get(filename)
+        if photo is not None:
+            self.canvas.itemconfig(self._cells[index], image=photo)
+        elif filename not in self._pending and filename not in self._failed:
+            self._pending[filename] = self._pool.submit(self.cache.get, filename)
+            if self._pollid is None:
+                self._pollid = self.after(ThumbnailGrid.POLL_MS, self._poll)
+
+    def _poll(self):
+        """Shows the thumbnails that have been made since the last poll, from the Tk thread."""
+        self._pollid = None
+        for filename, future in list(self._pending.items()):
+            if not future.done():
+                continue
+            del self._pending[filename]
+            try:
+                photo = ImageTk.PhotoImage(future.result())
+            except Exception:
+                # The cell keeps its name so the file can still be opened to see the error.
+                self._failed.add(filename)
+                continue
+            self._photos[filename] = photo
+            for index, item in self._cells.items():
+                if self.filenames[index] == filename:
+                    self.canvas.itemconfig(item, image=photo)
+        if self._pending:
+            self._pollid = self.after(ThumbnailGrid.POLL_MS, self._poll)
+
+    def _cellat(self, event):
+        """Returns the index of the cell under the mouse, or None."""
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        column = int(x // self.cellwidth)
+        index = int(y // self.cellheight) * self._columns + column
+        if column >= self._columns or not 0 <= index < len(self.filenames):
+            return None
+        return index
+
+    def _select(self, index):
+        self.selectedfile = self.filenames[index]
+        self.canvas.itemconfig("frame", outline="", fill="")
+        self.canvas.itemconfig("frame&&cell{}".format(index), outline="#69f", fill="#246")
+        self.event_generate("<<ThumbnailSelect>>")
+
+    def _onclick(self, event):
+        self.canvas.focus_set()
+        index = self._cellat(event)
+        if index is not None:
+            self._select(index)
+
+    def _ondoubleclick(self, event):
+        index = self._cellat(event)
+        if index is not None:
+            self._select(index)
+            self._open()
+
+    def _open(self):
+        if self.selectedfile is not None:
+            self.event_generate("<<ThumbnailOpen>>")
@@ -0,0 +1,95 @@
+#
+# A persistent cache of small previews of the game's image files.
+#
+# Each thumbnail is a PNG file named after the source file's path. The source's mtime and size
+# and the thumbnail size are written into the PNG, so a thumbnail is only reused while the
+# source file hasn't changed, and making a new one replaces the old file.
+#
+
+import hashlib
+import os
+
+from PIL import Image, PngImagePlugin
+
+from . import profiler
+from .imagefile import openimage
+
+# Where the viewer keeps thumbnails, relative to the working folder like folderindex.json.
+THUMBNAIL_FOLDER = "thumbnails"
+# The largest width or height of a thumbnail.
+THUMBNAIL_SIZE = 96
+
+# The PNG text chunk that holds the key of the source file.
+_KEY_CHUNK = "iotd-source"
+
+
+def thumbnailfilename(filename, folder=THUMBNAIL_FOLDER):
+    """Returns the name of the thumbnail file for an image file, kept in folder."""
+    digest = hashlib.sha1(os.path.abspath(filename).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(folder, "{}-{}.png".format(os.path.basename(filename), digest))
+
+
+def makethumbnail(image, size=THUMBNAIL_SIZE):
+    """Returns an RGB thumbnail of the first frame of an opened image, no larger than size x size."""
+    image.seek(0)
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((size, size))
+    return thumbnail
+
+
+class ThumbnailCache:
+    """
+    Makes thumbnails of image files and keeps them in folder, keyed by path, mtime and size.
+    get can be called from several threads at once, but not for the same file.
+    """
+
+    def __init__(self, folder=THUMBNAIL_FOLDER, size=THUMBNAIL_SIZE):
+        self.folder = folder
+        self.size = size
+
+    def _key(self, filename):
+        try:
+            st = os.stat(filename)
+        except OSError:
+            # Files that are only in a compiled container aren't cached.
+            return None
+        return "{} {} {}".format(st.st_mtime_ns, st.st_size, self.size)
+
+    def _read(self, thumbfilename, key):
+        try:
+            with profiler.timer("thumbnail.read"):
+                with Image.open(thumbfilename) as thumbnail:
+                    if thumbnail.info.get(_KEY_CHUNK) != key:
+                        return None
+                    thumbnail.load()
+                    return thumbnail
+        except (IOError, SyntaxError):
+            # A damaged thumbnail is made again.
+            return None
+
+    def _write(self, thumbfilename, thumbnail, key):
+        os.makedirs(self.folder, exist_ok=True)
+        info = PngImagePlugin.PngInfo()
+        info.add_text(_KEY_CHUNK, key)
+        # Write under another name first so that readers never see half a file.
+        tempfilename = thumbfilename + ".tmp"
+        try:
+            thumbnail.save(tempfilename, "PNG", pnginfo=info)
+            os.replace(tempfilename, thumbfilename)
+        except OSError:
+            # The thumbnail still works without the cache.
+            pass
+
+    def get(self, filename):
+        """Returns the thumbnail of an image file, making it and saving it in the cache if needed."""
+        key = self._key(filename)
+        thumbfilename = thumbnailfilename(filename, self.folder)
+        if key is not None:
+            thumbnail = self._read(thumbfilename, key)
+            if thumbnail is not None:
+                return thumbnail
+        with profiler.timer("thumbnail.make", file=os.path.basename(filename)):
+            thumbnail = makethumbnail(openimage(filename), self.size)
+        if key is not None:
+            self._write(thumbfilename, thumbnail, key)
+        return thumbnail
@@ -0,0 +1,13 @@
+import os
+
+import pytest
+
+from benchmarks.generate import makegame
+
+
+@pytest.fixture
+def game(tmp_path):
+    """A small synthetic game. Returns the game folder and an empty export folder."""
+    gamefolder = os.path.join(str(tmp_path), "GAME")
+    makegame(gamefolder, folders=1, cels=5, paks=1, flis=1)
+    return gamefolder, os.path.join(str(tmp_path), "out")
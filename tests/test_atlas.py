@@ -0,0 +1,63 @@
+#
+# Checks that atlases hold every frame and only the frames of files that could be read.
+#
+
+import json
+import os
+import random
+
+from PIL import Image
+
+from benchmarks.generate import writefli
+from extractor.atlas import AtlasWriter, atlasfiles
+
+
+def _frame(rnd, palette):
+    frame = Image.frombytes("P", (16, 12), bytes(rnd.randrange(256) for _ in range(16 * 12)))
+    frame.putpalette(palette)
+    return frame
+
+
+def _sheetframe(outbase, index, entry):
+    """Returns the pixels of an index entry, cropped from its sheet."""
+    sheet = Image.open(os.path.join(os.path.dirname(outbase), index["sheets"][entry["sheet"]]["file"]))
+    return sheet.crop((entry["x"], entry["y"], entry["x"] + entry["w"], entry["y"] + entry["h"]))
+
+
+def test_open_sheet_limit(tmp_path):
+    rnd = random.Random(6)
+    outbase = os.path.join(str(tmp_path), "atlas")
+    writer = AtlasWriter(outbase, maxsize=64, maxopensheets=2)
+    palettes = [bytes(rnd.randrange(256) for _ in range(768)) for _ in range(3)]
+    frames = []
+    for number, palette in enumerate((0, 1, 0, 2, 2, 1)):
+        frame = _frame(rnd, palettes[palette])
+        frames.append(frame)
+        writer.add(frame, "FRAMES", number, 100)
+        if number == 3:
+            # The third palette needed a sheet, so the least recently used one was saved.
+            assert writer.files == [outbase + "-1.png"]
+    assert writer.files == [outbase + "-1.png", outbase + "-0.png"]
+    files = writer.close()
+    assert len(files) == 5
+    with open(outbase + ".json") as f:
+        index = json.load(f)
+    assert [entry["sheet"] for entry in index["frames"]] == [0, 1, 0, 2, 2, 3]
+    for frame, entry in zip(frames, index["frames"]):
+        assert _sheetframe(outbase, index, entry).convert("RGB").tobytes() == frame.convert("RGB").tobytes()
+
+
+def test_failed_file_is_left_out(game, tmp_path):
+    gamefolder, exportfolder = game
+    broken = os.path.join(gamefolder, "BROKEN.FLI")
+    writefli(broken, random.Random(1), size=(32, 24), frames=10, changedlines=4)
+    # The first frames can still be decoded.
+    with open(broken, "r+b") as f:
+        f.truncate(os.path.getsize(broken) * 2 // 3)
+    wall = os.path.join(gamefolder, "AREA0", "WALL00.CEL")
+    outbase = os.path.join(str(tmp_path), "atlas")
+    files, errors = atlasfiles([broken, wall], outbase, gamefolder, dedupe=True)
+    assert [filename for filename, error in errors] == [broken]
+    with open(outbase + ".json") as f:
+        index = json.load(f)
+    assert [entry["source"] for entry in index["frames"]] == ["AREA0/WALL00.CEL"]
@@ -0,0 +1,60 @@
+#
+# Checks that files read from a compiled container look the same as the files themselves.
+#
+
+import os
+
+import pytest
+
+from benchmarks.generate import makegame
+from extractor.container import Container
+from extractor.exporter import compilecontainer, findfiles
+from extractor.imagefile import openfile
+
+
+def _rgbframes(image):
+    frames = []
+    for frame in range(getattr(image, "n_frames", 1)):
+        image.seek(frame)
+        frames.append(image.convert("RGB").tobytes())
+    return frames
+
+
+@pytest.fixture
+def container(tmp_path):
+    gamefolder = os.path.join(str(tmp_path), "GAME")
+    makegame(gamefolder, folders=1, cels=5, paks=1, flis=1)
+    containerfile = os.path.join(str(tmp_path), "game.iotd")
+    for result in compilecontainer(gamefolder, containerfile, jobs=1):
+        assert result.error is None, result.error
+    container = Container(containerfile)
+    yield gamefolder, container
+    container.close()
+
+
+def test_container_frames(container):
+    gamefolder, container = container
+    infilenames = [infilename for infilename, outfilebase in findfiles(gamefolder, "")]
+    assert infilenames
+    for infilename in infilenames:
+        image = container.open(infilename)
+        assert image is not None, infilename
+        assert _rgbframes(image) == _rgbframes(openfile(infilename)), infilename
+
+
+def test_container_changed_file(container):
+    gamefolder, container = container
+    infilename = os.path.join(gamefolder, "AREA0", "WALL00.CEL")
+    with open(infilename, "ab") as f:
+        f.write(b"\0")
+    assert container.open(infilename) is None
+
+
+def test_container_other_drive(container, monkeypatch):
+    gamefolder, container = container
+
+    def relpath(path, start):
+        raise ValueError("path is on mount 'D:', start on mount 'C:'")
+
+    monkeypatch.setattr(os.path, "relpath", relpath)
+    assert container.open(os.path.join(gamefolder, "AREA0", "WALL00.CEL")) is None
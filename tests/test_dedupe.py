@@ -0,0 +1,96 @@
+#
+# Checks that exports with dedupe encode files with identical frames once.
+#
+
+import json
+import os
+import shutil
+
+from extractor.exporter import exportall
+from extractor.manifest import ExportManifest
+
+
+def _export(gamefolder, exportfolder, dedupe):
+    """Exports the game on this process. Returns the number of duplicates and {source: output}."""
+    skipped, duplicates, results = exportall(gamefolder, exportfolder, jobs=1, dedupe=dedupe)
+    exported = {}
+    for result in results:
+        assert result.error is None, result
+        exported[os.path.relpath(result.infilename, gamefolder).replace(os.sep, "/")] = result.outfilename
+    return duplicates, exported
+
+
+def _copywall(gamefolder):
+    """Copies a CEL file next to itself. Returns the relative paths of the original and the copy."""
+    shutil.copyfile(os.path.join(gamefolder, "AREA0", "WALL00.CEL"), os.path.join(gamefolder, "AREA0", "COPY.CEL"))
+    return "AREA0/WALL00.CEL", "AREA0/COPY.CEL"
+
+
+def _canonical(exportfolder, relpath):
+    """Returns the source that relpath was recorded as a duplicate of, or None."""
+    with open(os.path.join(exportfolder, ExportManifest.MANIFEST_FILE)) as f:
+        return json.load(f)["files"][relpath].get("canonical")
+
+
+def _duplicatesjson(exportfolder):
+    with open(os.path.join(exportfolder, ExportManifest.DUPLICATES_FILE)) as f:
+        return json.load(f)
+
+
+def _pair(exportfolder, original, copy):
+    """Returns (canonical, duplicate) for two sources with the same frames, whichever was exported first."""
+    if _canonical(exportfolder, copy) == original:
+        return original, copy
+    assert _canonical(exportfolder, original) == copy
+    return copy, original
+
+
+def test_hardlink(game):
+    gamefolder, exportfolder = game
+    original, copy = _copywall(gamefolder)
+    duplicates, exported = _export(gamefolder, exportfolder, "hardlink")
+    assert duplicates == 1
+    assert exported[original] != exported[copy]
+    assert os.path.samefile(exported[original], exported[copy])
+
+
+def test_json(game):
+    gamefolder, exportfolder = game
+    original, copy = _copywall(gamefolder)
+    duplicates, exported = _export(gamefolder, exportfolder, "json")
+    assert duplicates == 1
+    canonical, duplicate = _pair(exportfolder, original, copy)
+    assert exported[duplicate] == exported[canonical]
+    assert not os.path.exists(os.path.join(exportfolder, os.path.splitext(duplicate)[0] + ".png"))
+    assert _duplicatesjson(exportfolder) == {duplicate: os.path.splitext(canonical)[0] + ".png"}
+
+
+def test_changed_canonical_exports_duplicate(game):
+    gamefolder, exportfolder = game
+    original, copy = _copywall(gamefolder)
+    _export(gamefolder, exportfolder, "json")
+    canonical, duplicate = _pair(exportfolder, original, copy)
+    with open(os.path.join(gamefolder, canonical), "r+b") as f:
+        data = f.read()
+        f.seek(0)
+        f.write(bytes(255 - byte for byte in data))
+    duplicates, exported = _export(gamefolder, exportfolder, "json")
+    # The duplicate gets an output of its own now that the frames differ.
+    assert sorted(exported) == sorted([canonical, duplicate])
+    assert duplicates == 0
+    assert exported[duplicate] != exported[canonical]
+    assert os.path.isfile(exported[duplicate])
+    assert _duplicatesjson(exportfolder) == {}
+
+
+def test_deleted_canonical_exports_duplicate(game):
+    gamefolder, exportfolder = game
+    original, copy = _copywall(gamefolder)
+    _export(gamefolder, exportfolder, "hardlink")
+    canonical, duplicate = _pair(exportfolder, original, copy)
+    os.remove(os.path.join(gamefolder, canonical))
+    duplicates, exported = _export(gamefolder, exportfolder, "hardlink")
+    assert list(exported) == [duplicate]
+    assert _canonical(exportfolder, duplicate) is None
+    assert os.path.isfile(exported[duplicate])
+    assert not os.path.exists(os.path.join(exportfolder, os.path.splitext(canonical)[0] + ".png"))
@@ -0,0 +1,21 @@
+#
+# Checks the index of the game folder's files.
+#
+
+import os
+
+import pytest
+
+from extractor.folderindex import FolderIndex
+
+
+def test_walk_skips_folder_links(game, tmp_path):
+    gamefolder, exportfolder = game
+    try:
+        # A link back to the game folder would be walked forever.
+        os.symlink(gamefolder, os.path.join(gamefolder, "AREA0", "LOOP"), target_is_directory=True)
+    except (OSError, NotImplementedError) as ex:
+        pytest.skip(str(ex))
+    index = FolderIndex(os.path.join(str(tmp_path), FolderIndex.INDEX_FILE))
+    walked = [(relpath, dirnames, len(filenames)) for relpath, dirnames, filenames in index.walk(gamefolder)]
+    assert walked == [("", ["AREA0"], 0), ("AREA0", [], 8)]
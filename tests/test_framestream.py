@@ -0,0 +1,86 @@
+#
+# Checks that FLI frames reached from the middle of an animation match decoding from the start.
+#
+
+import os
+import random
+
+import pytest
+from PIL import Image
+
+from benchmarks.generate import writefli
+from extractor import framestream
+from extractor.exporter import exportframes
+from extractor.imagefile import openimage
+from extractor.keyframes import KeyframeSeeker
+
+
+def _rgb(image):
+    return image.convert("RGB").tobytes()
+
+
+@pytest.fixture
+def animation(tmp_path):
+    """An FLI animation made of line deltas. Returns (file name, RGB pixels of each frame)."""
+    filename = os.path.join(str(tmp_path), "ANIM.FLI")
+    writefli(filename, random.Random(4), size=(64, 48), frames=20, changedlines=6)
+    image = openimage(filename)
+    frames = []
+    for frame in range(20):
+        image.seek(frame)
+        image.load()
+        frames.append(_rgb(image))
+    return filename, frames
+
+
+def test_iterframes_without_keyframes(animation, monkeypatch):
+    filename, expected = animation
+    monkeypatch.setattr(framestream, "canseek", lambda image: False)
+    frames = [_rgb(image) for frame, image in framestream.iterframes(openimage(filename), 10, 15)]
+    assert frames == expected[10:15]
+
+
+def test_exportframes_from_middle(animation, tmp_path):
+    filename, expected = animation
+    outfilenames = [os.path.join(str(tmp_path), "{}.png".format(frame)) for frame in range(10, 15)]
+    exportframes(filename, 10, outfilenames)
+    assert [_rgb(Image.open(outfilename)) for outfilename in outfilenames] == expected[10:15]
+
+
+def test_keyframeseeker(animation):
+    filename, expected = animation
+    seeker = KeyframeSeeker(openimage(filename))
+    for frame in (13, 3, 19, 0, 17, 9, 8):
+        seeker.seek(frame)
+        assert _rgb(seeker.image) == expected[frame], frame
+
+
+def test_keyframeseeker_sidecar(animation, tmp_path):
+    filename, expected = animation
+    sidecar = os.path.join(str(tmp_path), "ANIM.keyframes")
+    seeker = KeyframeSeeker(openimage(filename), sidecar=sidecar, writesidecar=True)
+    for frame in range(20):
+        seeker.seek(frame)
+    # A new seeker starts from the saved snapshot of frame 16.
+    seeker = KeyframeSeeker(openimage(filename), sidecar=sidecar)
+    for frame in (18, 5):
+        seeker.seek(frame)
+        assert _rgb(seeker.image) == expected[frame], frame
+
+
+def test_keyframeseeker_damaged_sidecar(animation, tmp_path):
+    filename, expected = animation
+    sidecar = os.path.join(str(tmp_path), "ANIM.keyframes")
+    seeker = KeyframeSeeker(openimage(filename), sidecar=sidecar, writesidecar=True)
+    for frame in range(20):
+        seeker.seek(frame)
+    # Save a snapshot of frame 16 that is missing its last row.
+    offset, data = seeker.keyframes[16]
+    seeker.keyframes[16] = offset, data[:-64]
+    seeker._dirty = True
+    seeker.savesidecar()
+    seeker = KeyframeSeeker(openimage(filename), sidecar=sidecar)
+    assert 16 not in seeker.keyframes
+    assert 8 in seeker.keyframes
+    seeker.seek(18)
+    assert _rgb(seeker.image) == expected[18]
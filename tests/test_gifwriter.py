@@ -0,0 +1,87 @@
+#
+# Checks that GifWriter's files decode to the frames that were written.
+#
+
+import io
+import random
+import struct
+
+from PIL import Image
+
+from extractor.gifwriter import GifWriter
+
+SIZE = (40, 30)
+
+
+def _frame(rnd, palette, base=None, box=None):
+    """Returns a "P" frame. With base, only the pixels inside box differ from it."""
+    if base is None:
+        frame = Image.frombytes("P", SIZE, bytes(rnd.randrange(256) for _ in range(SIZE[0] * SIZE[1])))
+    else:
+        frame = base.copy()
+        for y in range(box[1], box[3]):
+            for x in range(box[0], box[2]):
+                frame.putpixel((x, y), (frame.getpixel((x, y)) + 1 + rnd.randrange(255)) % 256)
+    frame.putpalette(palette)
+    return frame
+
+
+def _descriptors(data):
+    """Returns (left, top, width, height, has local color table) for each image in a GIF file."""
+    assert data[:6] == b"GIF89a"
+    position = 13 + 3 * 2 ** ((data[10] & 7) + 1) if data[10] & 0x80 else 13
+    descriptors = []
+
+    def skipblocks(position):
+        while data[position]:
+            position += data[position] + 1
+        return position + 1
+
+    while data[position] != 0x3b:
+        if data[position] == 0x21:
+            position = skipblocks(position + 2)
+        else:
+            assert data[position] == 0x2c
+            left, top, width, height, flags = struct.unpack("<HHHHB", data[position + 1:position + 10])
+            descriptors.append((left, top, width, height, bool(flags & 0x80)))
+            position += 10
+            if flags & 0x80:
+                position += 3 * 2 ** ((flags & 7) + 1)
+            position = skipblocks(position + 1)
+    return descriptors
+
+
+def test_roundtrip():
+    rnd = random.Random(5)
+    palette = bytes(rnd.randrange(256) for _ in range(768))
+    otherpalette = bytes(rnd.randrange(256) for _ in range(768))
+    first = _frame(rnd, palette)
+    second = _frame(rnd, palette, first, (5, 6, 17, 12))
+    # The same pixels again, so the frame is merged into the one before it.
+    third = second.copy()
+    fourth = second.copy()
+    fourth.putpalette(otherpalette)
+    fifth = _frame(rnd, otherpalette, fourth, (30, 20, 38, 29))
+    sixth = fifth.copy()
+    sixth.putpalette(palette)
+    fp = io.BytesIO()
+    writer = GifWriter(fp, loop=0)
+    for frame in (first, second, third, fourth, fifth, sixth):
+        writer.add(frame, 50)
+    writer.close()
+    data = fp.getvalue()
+    assert _descriptors(data) == [
+        (0, 0, 40, 30, False),
+        (5, 6, 12, 6, False),
+        # A frame with another palette is written whole with a local color table.
+        (0, 0, 40, 30, True),
+        (30, 20, 8, 9, True),
+        (0, 0, 40, 30, False),
+    ]
+    expected = [(first, 50), (second, 100), (fourth, 50), (fifth, 50), (sixth, 50)]
+    image = Image.open(io.BytesIO(data))
+    assert image.n_frames == len(expected)
+    for index, (frame, duration) in enumerate(expected):
+        image.seek(index)
+        assert image.convert("RGB").tobytes() == frame.convert("RGB").tobytes(), index
+        assert image.info["duration"] == duration, index
@@ -0,0 +1,34 @@
+#
+# Checks that the modules used without a window don't import tkinter.
+#
+
+import os
+import subprocess
+import sys
+
+HEADLESS_MODULES = [
+    "extractor.cli",
+    "extractor.arrays",
+    "extractor.asset",
+    "extractor.atlas",
+    "extractor.cache",
+    "extractor.container",
+    "extractor.exporter",
+    "extractor.folderindex",
+    "extractor.framestream",
+    "extractor.gifwriter",
+    "extractor.imagefile",
+    "extractor.keyframes",
+    "extractor.manifest",
+    "extractor.profiler",
+    "extractor.thumbnails",
+]
+
+
+def test_no_tkinter():
+    # A fresh interpreter, since other tests import tkinter.
+    code = "import sys\n{}\nprint('tkinter' in sys.modules)".format(
+        "\n".join("import " + module for module in HEADLESS_MODULES))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=root)
+    assert output.strip() == b"False"
@@ -0,0 +1,43 @@
+#
+# Checks animation playback in the image viewer. Skipped where Tk can't open a window.
+#
+
+import os
+import random
+import time
+
+import pytest
+
+from benchmarks.generate import writefli
+
+
+@pytest.fixture
+def root():
+    tix = pytest.importorskip("tkinter.tix")
+    try:
+        root = tix.Tk()
+    except tix.TclError as ex:
+        pytest.skip(str(ex))
+    errors = []
+    # Tk only prints errors raised in callbacks, so collect them to fail the test.
+    root.report_callback_exception = lambda *args: errors.append(args[1])
+    root.errors = errors
+    yield root
+    root.destroy()
+
+
+def test_zero_duration_animation(root, tmp_path):
+    from extractor.imagelabel import ImageLabel
+    filename = os.path.join(str(tmp_path), "FAST.FLI")
+    writefli(filename, random.Random(2), size=(32, 24), frames=8, changedlines=4, speed=0)
+    label = ImageLabel(root)
+    label.pack()
+    label.open(filename)
+    assert label.animation_speed == 0
+    label.animating.set(True)
+    timeout = time.monotonic() + 5
+    while label.animating.get() and not root.errors and time.monotonic() < timeout:
+        root.update()
+    assert root.errors == []
+    assert not label.animating.get()
+    assert label.currentframe.get() == 7
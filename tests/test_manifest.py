@@ -0,0 +1,106 @@
+#
+# Checks that exports skip the files that haven't changed since the last export.
+#
+
+import json
+import os
+import random
+
+from benchmarks.generate import writepak, writepalette
+from extractor import manifest
+from extractor.exporter import exportall
+from extractor.manifest import ExportManifest
+
+
+def _export(gamefolder, exportfolder, **kwargs):
+    """Exports the game on this process. Returns the skipped files and {source: output} for the rest."""
+    skipped, duplicates, results = exportall(gamefolder, exportfolder, jobs=1, **kwargs)
+    exported = {}
+    for result in results:
+        assert result.error is None, result
+        exported[os.path.relpath(result.infilename, gamefolder)] = result.outfilename
+    return skipped, exported
+
+
+def _area(name):
+    return os.path.join("AREA0", name)
+
+
+def test_unchanged_files_are_skipped(game):
+    gamefolder, exportfolder = game
+    skipped, exported = _export(gamefolder, exportfolder)
+    assert skipped == []
+    assert len(exported) == 8
+    assert ExportManifest.exists(exportfolder)
+    skipped, exported = _export(gamefolder, exportfolder)
+    assert len(skipped) == 8
+    assert exported == {}
+
+
+def test_touched_file_is_hashed_not_exported(game, monkeypatch):
+    gamefolder, exportfolder = game
+    _export(gamefolder, exportfolder)
+    wall = os.path.join(gamefolder, _area("WALL00.CEL"))
+    st = os.stat(wall)
+    os.utime(wall, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    hashed = []
+    hashfile = manifest._hashfile
+    monkeypatch.setattr(manifest, "_hashfile", lambda filename: hashed.append(filename) or hashfile(filename))
+    skipped, exported = _export(gamefolder, exportfolder)
+    assert exported == {}
+    assert wall in hashed
+    # The new mtime is saved, so the next export doesn't hash the file again.
+    del hashed[:]
+    _export(gamefolder, exportfolder)
+    assert wall not in hashed
+
+
+def test_changed_file_is_exported(game):
+    gamefolder, exportfolder = game
+    _export(gamefolder, exportfolder)
+    wall = os.path.join(gamefolder, _area("WALL01.CEL"))
+    with open(wall, "r+b") as f:
+        data = f.read()
+        f.seek(0)
+        f.write(bytes(255 - byte for byte in data))
+    skipped, exported = _export(gamefolder, exportfolder)
+    assert list(exported) == [_area("WALL01.CEL")]
+
+
+def test_palette_change_exports_its_files(game):
+    gamefolder, exportfolder = game
+    _export(gamefolder, exportfolder)
+    writepalette(os.path.join(gamefolder, _area("PALETTE.PAL")), random.Random(9))
+    skipped, exported = _export(gamefolder, exportfolder)
+    for name in ("TILES0.PAK", "WALL00.CEL", "WALL01.CEL", "WALL02.CEL", "WALL03.CEL"):
+        assert _area(name) in exported
+    # FLI animations hold their own palette.
+    assert os.path.join(gamefolder, _area("ANIM0.FLI")) in skipped
+
+
+def test_vanished_file_output_is_deleted(game):
+    gamefolder, exportfolder = game
+    skipped, exported = _export(gamefolder, exportfolder)
+    output = exported[_area("WALL02.CEL")]
+    assert os.path.isfile(output)
+    os.remove(os.path.join(gamefolder, _area("WALL02.CEL")))
+    skipped, exported = _export(gamefolder, exportfolder)
+    assert exported == {}
+    assert not os.path.exists(output)
+    with open(os.path.join(exportfolder, ExportManifest.MANIFEST_FILE)) as f:
+        assert "AREA0/WALL02.CEL" not in json.load(f)["files"]
+
+
+def test_new_output_replaces_old(game):
+    gamefolder, exportfolder = game
+    pak = os.path.join(gamefolder, _area("EXTRA.PAK"))
+    writepak(pak, random.Random(3), 1)
+    skipped, exported = _export(gamefolder, exportfolder)
+    png = exported[_area("EXTRA.PAK")]
+    assert png.endswith(".png")
+    # With more frames the file is exported as a GIF, and the PNG is deleted.
+    writepak(pak, random.Random(3), 3)
+    skipped, exported = _export(gamefolder, exportfolder)
+    assert exported[_area("EXTRA.PAK")].endswith(".gif")
+    assert os.path.isfile(exported[_area("EXTRA.PAK")])
+    assert not os.path.exists(png)
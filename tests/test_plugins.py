@@ -0,0 +1,75 @@
+#
+# Checks the decoded colors of the CEL and PAK plugins against the raw file data.
+#
+
+import os
+import random
+
+import pytest
+
+from extractor.imagefile import openimage
+from extractor.pil import CelImagePlugin, PakImagePlugin
+
+
+def _writefile(filename, data):
+    with open(filename, "wb") as f:
+        f.write(data)
+    return filename
+
+
+def _randombytes(rnd, count):
+    return bytes(rnd.randrange(256) for _ in range(count))
+
+
+@pytest.fixture
+def folder(tmp_path):
+    """A folder with a PALETTE.PAL file. Returns (folder, 8-bit RGB palette data)."""
+    CelImagePlugin.clearpalettecache()
+    rnd = random.Random(1)
+    vgapalette = bytes(rnd.randrange(64) for _ in range(768))
+    _writefile(os.path.join(str(tmp_path), "PALETTE.PAL"), vgapalette)
+    return str(tmp_path), bytes(x * 4 for x in vgapalette)
+
+
+def _columnmajor(data, palette, width, height):
+    """Returns the RGB pixels of column-major palette indexes, row by row."""
+    return bytes(b for y in range(height) for x in range(width)
+                 for b in palette[data[x * height + y] * 3:data[x * height + y] * 3 + 3])
+
+
+def _rowmajor(data, palette):
+    return b"".join(palette[index * 3:index * 3 + 3] for index in data)
+
+
+@pytest.mark.parametrize("filesize, size", [(4096, (64, 64)), (4160, (64, 65)), (3594, (56, 64))])
+def test_headerless_cel(folder, filesize, size):
+    folder, palette = folder
+    data = _randombytes(random.Random(filesize), filesize)
+    image = openimage(_writefile(os.path.join(folder, "WALL.CEL"), data))
+    image.load()
+    assert image.size == size
+    assert image.convert("RGB").tobytes() == _columnmajor(data, palette, *size)
+
+
+def test_header_cel(tmp_path):
+    rnd = random.Random(2)
+    vgapalette = bytes(rnd.randrange(64) for _ in range(768))
+    data = _randombytes(rnd, 40 * 30)
+    header = b"\x19\x91" + (40).to_bytes(2, "little") + (30).to_bytes(2, "little")
+    filename = _writefile(os.path.join(str(tmp_path), "SCREEN.CEL"),
+                          header.ljust(0x20, b"\0") + vgapalette + data)
+    image = openimage(filename)
+    assert image.convert("RGB").tobytes() == _rowmajor(data, bytes(x * 4 for x in vgapalette))
+
+
+@pytest.mark.parametrize("usemmap", [True, False])
+def test_pak_frames(folder, monkeypatch, usemmap):
+    folder, palette = folder
+    monkeypatch.setattr(PakImagePlugin.PakImageFile, "usemmap", usemmap)
+    data = _randombytes(random.Random(3), 4096 * 5)
+    image = openimage(_writefile(os.path.join(folder, "TILES.PAK"), data))
+    for frame in (0, 1, 2, 4, 3, 0):
+        image.seek(frame)
+        image.load()
+        framedata = data[frame * 4096:(frame + 1) * 4096]
+        assert image.convert("RGB").tobytes() == _columnmajor(framedata, palette, 64, 64), frame